@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     ]
 
 MIDDLEWARE = [
+    'ecommerce.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +86,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'ecommerce.context_processors.global_context',
                 'cart.context_processors.cart',
+                'cart.context_processors.cart_length',
             ],
         },
     },
@@ -151,6 +153,16 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'ecommerce', 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per distinct content under CONTENT_STORAGE_PREFIX
+# (see ecommerce.storage); `manage.py gc_media` removes unreferenced blobs
+# older than MEDIA_GC_GRACE_PERIOD seconds.
+STORAGES = {
+    'default': {'BACKEND': 'ecommerce.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+CONTENT_STORAGE_PREFIX = 'blobs'
+MEDIA_GC_GRACE_PERIOD = 3600
+
 # Authentication and redirect settings
 LOGIN_REDIRECT_URL = 'home'  
 LOGOUT_REDIRECT_URL = 'home'
@@ -165,3 +177,149 @@ EMAIL_HOST_USER = 'sidharthpoudel04@gmail.com'
 EMAIL_HOST_PASSWORD = 'nrcp jrha znqq lypd'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Version keys (catalog, review pages) are bumped by signals in one
+# worker and read by all of them, so the default cache must be shared between
+# processes; `manage.py check` fails on LocMemCache (ecommerce.E001). The file
+# cache works for workers on one host; use Redis or Memcached across hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, '.django_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+# Catalog reference data (navbar/footer sections of global_context) is kept as
+# per-worker snapshots keyed by a version stored in the default cache.
+CATALOG_CACHE_TIMEOUT = 300
+
+# Product page views are buffered and written back with F() updates. Views are
+# flushed every VIEW_COUNTER_FLUSH_INTERVAL seconds or once
+# VIEW_COUNTER_MAX_PENDING are buffered, whichever comes first; together they
+# bound how many views a crashed worker can lose. Setting
+# VIEW_COUNTER_SPOOL_DIR switches to an append-only spool drained by
+# `manage.py flush_view_counts`.
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+VIEW_COUNTER_MAX_PENDING = 500
+VIEW_COUNTER_SPOOL_DIR = None
+
+# Product search uses an SQLite FTS5 table ranked with BM25 and falls back to
+# an in-process inverted index elsewhere ('memory' forces the fallback).
+SEARCH_BACKEND = 'auto'
+SEARCH_MAX_RESULTS = 500
+SEARCH_FALLBACK_REBUILD_INTERVAL = 300
+
+# XHR search results are returned a page at a time behind keyset cursors;
+# pages larger than SEARCH_STREAM_THRESHOLD rows are streamed.
+SEARCH_PAGE_SIZE = 24
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_STREAM_THRESHOLD = 50
+
+# Ordered product-id lists for search and category filters are cached per
+# worker, keyed by the canonicalized parameters and the catalog version.
+RESULT_CACHE_TIMEOUT = 120
+RESULT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Lower edges of the price histogram shown with search facets.
+FACET_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+# After a catalog change the facet columns are rebuilt by a background thread
+# while the previous ones keep serving; False rebuilds in the request.
+FACET_BACKGROUND_REBUILD = True
+
+# Autocomplete for /search/suggest/ is served from a per-process prefix index.
+# Rows whose updated_at passed the watermark are merged every
+# SUGGEST_REFRESH_INTERVAL seconds; a full rebuild (deletions, new weights)
+# runs every SUGGEST_REBUILD_INTERVAL. SUGGEST_MAX_PRODUCTS bounds build time.
+SUGGEST_REFRESH_INTERVAL = 30
+SUGGEST_REBUILD_INTERVAL = 3600
+SUGGEST_MAX_PRODUCTS = 50000
+SUGGEST_MAX_LIMIT = 10
+SUGGEST_SALES_WEIGHT = 10
+
+# Home page recommendations merge the co-purchase neighbours (built offline by
+# `manage.py build_recommendations`) of a user's most recent purchases.
+RECOMMENDATION_NEIGHBORS = 20
+RECOMMENDATION_MAX_BASKET = 100
+RECOMMENDATION_RECENT_PURCHASES = 10
+RECOMMENDATION_LIMIT = 12
+RECOMMENDATION_CACHE_TIMEOUT = 600
+
+# Related products on the detail page are precomputed (see
+# `manage.py build_related_products`) and refreshed when a product's
+# category, brand or tags change.
+RELATED_PRODUCTS_STORED = 12
+RELATED_PRODUCTS_CANDIDATES = 500
+
+# Product reviews are served in keyset pages; the first page of each ordering
+# is rendered once per product and cached until a review changes.
+REVIEW_PAGE_SIZE = 10
+REVIEW_MAX_PAGE_SIZE = 50
+REVIEW_CACHE_TIMEOUT = 600
+
+# Anonymous, cookie-less requests for catalog pages are answered from a page
+# cache keyed on the catalog version. Concurrent misses wait up to
+# PAGE_CACHE_WAIT seconds for the request holding the render lock.
+PAGE_CACHE_TIMEOUT = 300
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_WAIT = 2
+
+# Uploaded images get resized WebP and JPEG/PNG renditions rendered in a
+# process pool (`manage.py build_image_renditions` backfills existing media).
+# IMAGE_RENDITION_SIZES is the default `sizes` attribute of responsive_image.
+IMAGE_RENDITION_WIDTHS = [160, 320, 640, 1280]
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_RENDITION_WORKERS = None
+IMAGE_RENDITION_SIZES = '(max-width: 576px) 50vw, 320px'
+
+# Media is served by ecommerce.views.serve_media. 'django' streams files with
+# FileResponse; 'x-accel-redirect' (nginx, internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX) and 'x-sendfile' (Apache/lighttpd) hand the
+# transfer to the front proxy. Content-hashed files are cached for a year,
+# everything else for MEDIA_CACHE_MAX_AGE seconds.
+MEDIA_SERVE_MODE = 'django'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 3600
+
+# Rendered product cards ({% product_card %}) are kept in a per-process LRU of
+# PRODUCT_CARD_CACHE_SIZE entries in front of the shared cache.
+PRODUCT_CARD_CACHE_SIZE = 2000
+PRODUCT_CARD_CACHE_TIMEOUT = 3600
+
+# Catalog listings (brand, store, category, sale) are paged with keyset
+# cursors; their totals are counted once per catalog version.
+LISTING_PAGE_SIZE = 24
+LISTING_MAX_PAGE_SIZE = 100
+LISTING_COUNT_TIMEOUT = 600
+
+# Per-request query budgets, keyed by URL name (ecommerce.query_budget).
+# Exceeding one is logged, or raises QueryBudgetExceeded when
+# QUERY_BUDGET_RAISE is set (ECOM.test_settings does); a SQL shape run
+# QUERY_BUDGET_REPEAT_THRESHOLD times in one request is logged as a likely N+1.
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_DEFAULT = 30
+# Measured from cold caches as a signed-in customer (the costlier case; see
+# ecommerce.tests.QueryBudgetTests), plus two queries of headroom.
+QUERY_BUDGETS = {
+    'home': 16,
+    'product_detail': 22,
+    'brand_products': 14,
+    'store_detail': 14,
+    'category_detail': 14,
+    'search': 18,
+    'cart:cart_detail': 10,
+    'cart:order_detail': 17,
+    'cart:order_detail_view': 14,
+}
+QUERY_BUDGET_REPEAT_THRESHOLD = 5
+QUERY_BUDGET_RAISE = False
+
+# Where signed-in customers' carts live: 'cart.storage.DatabaseCartStore'
+# (CartLine rows, written per line) or 'cart.storage.SessionCartStore'.
+# Anonymous carts always use the session and merge in at login.
+CART_STORAGE = 'cart.storage.DatabaseCartStore'
+
+# Most operations one /cart/ops/ request may carry, and most units of one
+# product a cart line may hold.
+CART_OPS_MAX = 100
+CART_MAX_QUANTITY = 100
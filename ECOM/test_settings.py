@@ -0,0 +1,16 @@
+"""
+Settings for the test suite: ``python manage.py test --settings=ECOM.test_settings``.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+# Over-budget requests fail the test that made them.
+QUERY_BUDGET_RAISE = True
+
+# One process runs the tests, so a local cache is shared by everything that
+# reads a version key; tests clear it between cases.
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SILENCED_SYSTEM_CHECKS = ['ecommerce.E001']
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
@@ -1,14 +1,54 @@
+from django.conf import settings
 from ecommerce.models import Product
-from decimal import Decimal
 from django.shortcuts import get_object_or_404
+from . import pricing, storage
+
+# Product fields the cart pages, totals and checkout read.
+PRODUCT_FIELDS = ('id', 'name', 'price', 'sale_price', 'on_sale', 'price_version', 'product_image', 'stock', 'availability', 'updated_at')
+
+
+def line_prices(product):
+    """The prices (in cents) a cart line is charged at, and the price version they came from."""
+    return {
+        'price': pricing.to_cents(product.price),
+        'sale_price': pricing.to_cents(product.sale_price),
+        'version': product.price_version,
+    }
+
+
+class CartOperationError(ValueError):
+    pass
+
+
+def max_quantity():
+    return getattr(settings, 'CART_MAX_QUANTITY', 100)
+
+
+def get_cart(request):
+    """The request's Cart; views, context processors and templates share it."""
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
+
 
 class Cart:
+    """
+    The customer's cart, kept by the store ``storage.store_for`` picks.
+    Lines map product ids to {'quantity', 'price', 'sale_price', 'version'},
+    with prices in cents; they are loaded the first time they are read.
+    """
+
     def __init__(self, request):
-        self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        self.store = storage.store_for(request)
+        self._cart = None
+        self._lines = None
+        self._products = None
+
+    @property
+    def cart(self):
+        if self._cart is None:
+            self._cart = self.store.load()
+        return self._cart
 
     def add(self, product, quantity=1):
         product_id = str(product.id)
@@ -16,78 +56,152 @@ class Cart:
         if product.price is None:
             raise ValueError("Product price cannot be None")
 
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price),
-                'sale_price': str(product.sale_price) if product.sale_price is not None else None,
-            }
-
-        self.cart[product_id]['quantity'] += quantity
+        line = self.cart.get(product_id) or dict(line_prices(product), quantity=0)
+        line = dict(line, quantity=line['quantity'] + quantity)
 
-        if self.cart[product_id]['quantity'] <= 0:
-            del self.cart[product_id]  # Remove item if quantity is 0 or less
-
-        self.save()
+        if line['quantity'] <= 0:
+            self.update(removed=[product_id])  # Remove item if quantity is 0 or less
+        else:
+            self.update(changed={product_id: line})
 
     def remove(self, product):
         product_id = str(product.id)
         if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+            self.update(removed=[product_id])
 
     def clear(self):
-        self.cart = {}
-        self.save()
+        self._cart = {}
+        self.store.clear()
+        self._changed()
+
+    def update(self, changed=None, removed=()):
+        """Apply changed ({product id: line}) and removed lines and write just those."""
+        changed = changed or {}
+        self.cart.update(changed)
+        for product_id in removed:
+            self.cart.pop(product_id, None)
+        self.store.save(self.cart, changed=list(changed), removed=list(removed))
+        self._changed()
+
+    def apply(self, operations):
+        """
+        Apply ``operations``, a list of (op, product id, quantity) with op one
+        of 'add', 'set' or 'remove', all or nothing: they are checked and
+        applied to a copy of the lines, and the result is written with one
+        store update. A line may not grow beyond its product's stock or
+        CART_MAX_QUANTITY. The products of the cart and of every operation
+        are loaded with one query. Returns the ids of the lines touched.
+        """
+        ids = {int(product_id) for product_id in self.cart} | {product_id for _, product_id, _ in operations}
+        if self._products is None or not ids <= self._products.keys():
+            self._products = Product.objects.only(*PRODUCT_FIELDS).in_bulk(list(ids))
+        lines = dict(self.cart)
+        touched = []
+        for op, product_id, quantity in operations:
+            key = str(product_id)
+            product = self._products.get(product_id)
+            if op == 'remove':
+                lines.pop(key, None)
+            elif product is None:
+                raise CartOperationError(f"Product {product_id} does not exist.")
+            elif op == 'add':
+                line = lines.get(key) or dict(line_prices(product), quantity=0)
+                lines[key] = dict(line, quantity=line['quantity'] + quantity)
+            elif op == 'set':
+                if quantity:
+                    lines[key] = dict(lines.get(key) or line_prices(product), quantity=quantity)
+                else:
+                    lines.pop(key, None)
+            else:
+                raise CartOperationError(f"Unknown operation {op!r}.")
+            if key in lines:
+                held = lines[key]['quantity']
+                if held > max_quantity():
+                    raise CartOperationError(f"A line can hold at most {max_quantity()} units.")
+                # Lines already above the stock may still shrink.
+                if held > product.stock and held > self.cart.get(key, {}).get('quantity', 0):
+                    raise CartOperationError(f"Only {product.stock} of {product.name} left in stock.")
+            if key not in touched:
+                touched.append(key)
+
+        changed = {key: lines[key] for key in touched if key in lines and lines[key] != self.cart.get(key)}
+        removed = [key for key in touched if key not in lines and key in self.cart]
+        if changed or removed:
+            self.update(changed, removed)
+        return touched
+
+    def _changed(self):
+        self._lines = None
+        if self._products is not None and not {int(product_id) for product_id in self.cart} <= self._products.keys():
+            self._products = None
+
+    @property
+    def revision(self):
+        return self.store.revision
+
+    def products(self):
+        """{id: product} for the cart's lines, fetched in one query per request."""
+        if self._products is None:
+            self._products = Product.objects.only(*PRODUCT_FIELDS).in_bulk([int(product_id) for product_id in self.cart])
+        return self._products
+
+    def reconcile(self):
+        """
+        Re-price the lines whose product changed its prices since they were
+        added (its price version moved on) and drop lines whose product is
+        gone. Returns (product or None, old line, new line or None) for every
+        line whose charged prices changed.
+        """
+        products = self.products()
+        changes = []
+        changed = {}
+        removed = []
+        for product_id, item in self.cart.items():
+            product = products.get(int(product_id))
+            if product is None:
+                removed.append(product_id)
+                changes.append((None, item, None))
+            elif item.get('version') != product.price_version:
+                line = dict(item, **line_prices(product))
+                changed[product_id] = line
+                if (line['price'], line['sale_price']) != (item.get('price'), item.get('sale_price')):
+                    changes.append((product, item, line))
+        if changed or removed:
+            self.update(changed, removed)
+        return changes
+
+    @property
+    def lines(self):
+        """
+        The cart lines with their products, fetched in one query the first
+        time they are needed. Lines are copies, so no model instance ends up
+        in the session.
+        """
+        if self._lines is None:
+            products = self.products()
+            line_totals = pricing.totals_for(self)['lines']
+            self._lines = [
+                dict(
+                    item,
+                    product=products.get(int(product_id)),
+                    total_price=pricing.from_cents(line_totals[product_id]),
+                )
+                for product_id, item in self.cart.items()
+            ]
+        return self._lines
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-
-        for product in products:
-            self.cart[str(product.id)]['product'] = product
-
-        for item in self.cart.values():
-            price = item.get('price')
-            sale_price = item.get('sale_price')
-            quantity = item.get('quantity', 0)
-
-            if sale_price and Decimal(sale_price) < Decimal(price):
-                item['total_price'] = Decimal(sale_price) * quantity
-            else:
-                item['total_price'] = Decimal(price) * quantity
+        return iter(self.lines)
 
-            yield item
+    def __len__(self):
+        return len(self.cart)
 
-    def save(self):
-        self.session['cart'] = self.cart
-        self.session.modified = True
+    def summary(self):
+        """{'lines', 'quantity'}: counted from the lines once loaded, else asked of the store."""
+        if self._cart is not None:
+            lines, quantity = storage.count(self._cart)
+            return {'lines': lines, 'quantity': quantity}
+        return self.store.summary()
 
     def get_total_price(self):
-        total = Decimal('0.00')
-        subtotal = Decimal('0.00')
-        discount_total = Decimal('0.00')
-
-        for item in self.cart.values():
-            price = Decimal(item.get('price', '0.00'))
-            sale_price = item.get('sale_price')
-            quantity = item.get('quantity', 0)
-
-            if quantity > 0:
-                item_price = Decimal(sale_price) if sale_price and Decimal(sale_price) < price else price
-                item_total = item_price * quantity
-
-                subtotal += price * quantity
-                total += item_total
-
-                if sale_price and Decimal(sale_price) < price:
-                    discount_total += (price - Decimal(sale_price)) * quantity
-
-        discount_percentage = (discount_total / subtotal * 100) if subtotal > 0 else Decimal('0.00')
-
-        return {
-            'total': total,
-            'subtotal': subtotal,
-            'discount_total': discount_total,
-            'discount_percentage': discount_percentage.quantize(Decimal('0.01'))
-        }
\ No newline at end of file
+        return pricing.present(pricing.totals_for(self))
@@ -1,12 +1,11 @@
-from .cart import Cart
+from .cart import get_cart
 
 def cart(request):
-    return {'cart': Cart(request)}
+    return {'cart': get_cart(request)}
 
 def cart_length(request):
     if request.user.is_authenticated:
-        cart = Cart(request)
-        cart_qty = len(cart.cart)
+        cart_qty = get_cart(request).summary()['lines']
     else:
         cart_qty = 0 
 
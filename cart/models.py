@@ -50,3 +50,23 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment for Order #{self.order.id} by {self.user.username}"
+
+
+class CartLine(models.Model):
+    """One line of a signed-in customer's cart (cart.storage.DatabaseCartStore)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    # Prices in minor units, as charged when the line was last priced.
+    price_cents = models.PositiveBigIntegerField()
+    sale_price_cents = models.PositiveBigIntegerField(null=True, blank=True)
+    price_version = models.PositiveIntegerField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_cartline_unique_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} (x{self.quantity}) for user {self.user_id}"
@@ -0,0 +1,77 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Session key holding the totals computed for a session cart's revision.
+TOTALS_KEY = 'cart_totals'
+
+
+def to_cents(value):
+    """Parse a price (string, Decimal or number) into integer minor units."""
+    if value is None or value == '':
+        return None
+    return int((Decimal(str(value)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def unit_cents(price, sale_price):
+    """(list price, charged price) of one unit in cents; a sale price only counts when lower."""
+    price = price or 0
+    return price, sale_price if sale_price is not None and sale_price < price else price
+
+
+def line_total(item):
+    """Charged amount of one cart line, in cents."""
+    _, charged = unit_cents(item.get('price'), item.get('sale_price'))
+    return charged * item.get('quantity', 0)
+
+
+def compute(lines):
+    """
+    Price every line of ``lines`` ({product id: line}, prices in cents) in
+    one pass. Amounts are integer cents; the discount percentage is in basis
+    points.
+    """
+    subtotal = discount = 0
+    line_totals = {}
+    for product_id, item in lines.items():
+        quantity = item.get('quantity', 0)
+        if quantity <= 0:
+            line_totals[product_id] = 0
+            continue
+        price, charged = unit_cents(item.get('price'), item.get('sale_price'))
+        subtotal += price * quantity
+        discount += (price - charged) * quantity
+        line_totals[product_id] = charged * quantity
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'total': subtotal - discount,
+        'discount_bp': (discount * 10000 + subtotal // 2) // subtotal if subtotal else 0,
+        'lines': line_totals,
+    }
+
+
+def present(totals):
+    """The totals as Decimals, in the shape templates and checkout use."""
+    return {
+        'subtotal': from_cents(totals['subtotal']),
+        'discount_total': from_cents(totals['discount']),
+        'discount_percentage': from_cents(totals['discount_bp']),
+        'total': from_cents(totals['total']),
+    }
+
+
+def totals_for(cart):
+    """
+    Totals of ``cart``, memoized by its store for the current revision so
+    they are only recomputed after the cart changes. Checkout computes its
+    amounts directly instead.
+    """
+    revision = cart.revision
+    totals = cart.store.get_totals(revision)
+    if totals is None:
+        totals = compute(cart.cart)
+        cart.store.set_totals(revision, totals)
+    return totals
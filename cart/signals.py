@@ -0,0 +1,11 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from . import storage
+
+
+@receiver(user_logged_in, dispatch_uid='cart_merge_on_login')
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        # store_for() folds the session cart into the customer's stored cart.
+        storage.store_for(request, user)
@@ -0,0 +1,177 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils.module_loading import import_string
+
+from . import pricing
+from .models import CartLine
+
+SESSION_KEY = 'cart'
+REVISION_KEY = 'cart_revision'
+SUMMARY_KEY = 'cart_summary'
+
+
+def pack(product_id, line):
+    """A line as a compact row: [product id, quantity, price cents, sale price cents, price version]."""
+    return [int(product_id), line['quantity'], line['price'], line['sale_price'], line.get('version')]
+
+
+def unpack(row):
+    product_id, quantity, price, sale_price, version = row
+    return str(product_id), {'quantity': quantity, 'price': price, 'sale_price': sale_price, 'version': version}
+
+
+def count(lines):
+    """The badge counters of ``lines``: number of lines and total quantity."""
+    return len(lines), sum(line['quantity'] for line in lines.values())
+
+
+def _from_legacy(lines):
+    # Session carts written before lines were packed kept prices as strings.
+    return {
+        product_id: {
+            'quantity': item.get('quantity', 0),
+            'price': pricing.to_cents(item.get('price')) or 0,
+            'sale_price': pricing.to_cents(item.get('sale_price')),
+            'version': item.get('version'),
+        }
+        for product_id, item in lines.items()
+    }
+
+
+class SessionCartStore:
+    """Cart lines packed into the session; anonymous visitors always use it."""
+
+    def __init__(self, request, user=None):
+        self.session = request.session
+
+    def load(self):
+        rows = self.session.get(SESSION_KEY) or []
+        if isinstance(rows, dict):
+            return _from_legacy(rows)
+        return dict(unpack(row) for row in rows)
+
+    def save(self, lines, changed=(), removed=()):
+        self.session[SESSION_KEY] = [pack(product_id, line) for product_id, line in lines.items()]
+        self.session[REVISION_KEY] = self.revision + 1
+        self.session[SUMMARY_KEY] = list(count(lines))
+
+    def clear(self):
+        self.save({})
+
+    def discard(self):
+        for key in (SESSION_KEY, REVISION_KEY, SUMMARY_KEY, pricing.TOTALS_KEY):
+            self.session.pop(key, None)
+
+    @property
+    def revision(self):
+        return self.session.get(REVISION_KEY, 0)
+
+    def summary(self):
+        counters = self.session.get(SUMMARY_KEY)
+        if counters is None:
+            counters = count(self.load())
+        return {'lines': counters[0], 'quantity': counters[1]}
+
+    def get_totals(self, revision):
+        cached = self.session.get(pricing.TOTALS_KEY)
+        if cached and cached.get('revision') == revision:
+            return cached['totals']
+        return None
+
+    def set_totals(self, revision, totals):
+        self.session[pricing.TOTALS_KEY] = {'revision': revision, 'totals': totals}
+
+
+class DatabaseCartStore:
+    """
+    Cart lines as CartLine rows, upserted or deleted one line at a time, so
+    a cart action no longer rewrites the whole session. Nothing about the
+    rows is cached between requests: totals are computed from the rows
+    load() read, so a change made elsewhere (another worker, the admin, a
+    product deleted in cascade) is what the cart shows and checkout charges.
+    """
+
+    def __init__(self, request, user=None):
+        self.user = user if user is not None else request.user
+        # Counts this instance's writes; it only keys the per-request totals.
+        self.revision = 0
+        self._totals = None
+
+    def load(self):
+        rows = CartLine.objects.filter(user=self.user).values_list(
+            'product_id', 'quantity', 'price_cents', 'sale_price_cents', 'price_version')
+        return dict(unpack(row) for row in rows)
+
+    def save(self, lines, changed=(), removed=()):
+        with transaction.atomic():
+            if removed:
+                CartLine.objects.filter(user=self.user, product_id__in=[int(product_id) for product_id in removed]).delete()
+            if changed:
+                CartLine.objects.bulk_create(
+                    [
+                        CartLine(
+                            user=self.user,
+                            product_id=int(product_id),
+                            quantity=lines[product_id]['quantity'],
+                            price_cents=lines[product_id]['price'],
+                            sale_price_cents=lines[product_id]['sale_price'],
+                            price_version=lines[product_id].get('version'),
+                        )
+                        for product_id in changed
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['user', 'product'],
+                    update_fields=['quantity', 'price_cents', 'sale_price_cents', 'price_version', 'updated_at'],
+                )
+        self.revision += 1
+
+    def clear(self):
+        CartLine.objects.filter(user=self.user).delete()
+        self.revision += 1
+
+    def summary(self):
+        """The badge counters, counted from the rows with one aggregate query."""
+        totals = CartLine.objects.filter(user=self.user).aggregate(lines=Count('id'), quantity=Sum('quantity'))
+        return {'lines': totals['lines'], 'quantity': totals['quantity'] or 0}
+
+    def get_totals(self, revision):
+        if self._totals is not None and self._totals[0] == revision:
+            return self._totals[1]
+        return None
+
+    def set_totals(self, revision, totals):
+        self._totals = (revision, totals)
+
+
+def user_store_class():
+    return import_string(getattr(settings, 'CART_STORAGE', 'cart.storage.DatabaseCartStore'))
+
+
+def merge_session_cart(request, store):
+    """Move the lines of an anonymous session cart into ``store``."""
+    anonymous = SessionCartStore(request)
+    lines = anonymous.load()
+    anonymous.discard()
+    if not lines:
+        return
+    merged = store.load()
+    for product_id, line in lines.items():
+        if product_id in merged:
+            merged[product_id] = dict(merged[product_id], quantity=merged[product_id]['quantity'] + line['quantity'])
+        else:
+            merged[product_id] = line
+    store.save(merged, changed=list(lines))
+
+
+def store_for(request, user=None):
+    """Signed-in customers use CART_STORAGE; anonymous visitors the session."""
+    user = user if user is not None else request.user
+    if not user.is_authenticated:
+        return SessionCartStore(request)
+    store_class = user_store_class()
+    store = store_class(request, user)
+    if store_class is not SessionCartStore and SESSION_KEY in request.session:
+        # Left over from before login (or from before carts were stored per line).
+        merge_session_cart(request, store)
+    return store
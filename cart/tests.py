@@ -1,3 +1,279 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from ecommerce.models import Product
+from ecommerce.tests import CatalogTestCase
+from . import pricing
+from .models import CartLine, Order
+
+
+class PricingTests(SimpleTestCase):
+    def test_to_cents_rounds_half_up(self):
+        self.assertEqual(pricing.to_cents('19.995'), 2000)
+        self.assertEqual(pricing.to_cents('0.105'), 11)
+        self.assertEqual(pricing.to_cents(Decimal('0.104')), 10)
+        self.assertEqual(pricing.to_cents(12), 1200)
+
+    def test_to_cents_of_missing_price(self):
+        self.assertIsNone(pricing.to_cents(None))
+        self.assertIsNone(pricing.to_cents(''))
+
+    def test_from_cents(self):
+        self.assertEqual(pricing.from_cents(1999), Decimal('19.99'))
+        self.assertEqual(str(pricing.from_cents(5)), '0.05')
+
+    def test_sale_price_only_counts_when_lower(self):
+        self.assertEqual(pricing.unit_cents(1000, 800), (1000, 800))
+        self.assertEqual(pricing.unit_cents(1000, 1200), (1000, 1000))
+        self.assertEqual(pricing.unit_cents(1000, None), (1000, 1000))
+
+    def test_compute(self):
+        totals = pricing.compute({
+            '1': {'quantity': 3, 'price': 333, 'sale_price': None},
+            '2': {'quantity': 1, 'price': 1000, 'sale_price': 667},
+            '3': {'quantity': 0, 'price': 500, 'sale_price': None},
+        })
+        self.assertEqual(totals['subtotal'], 1999)
+        self.assertEqual(totals['discount'], 333)
+        self.assertEqual(totals['total'], 1666)
+        self.assertEqual(totals['lines'], {'1': 999, '2': 667, '3': 0})
+        # 333 / 1999 = 16.658%, rounded to basis points.
+        self.assertEqual(totals['discount_bp'], 1666)
+        self.assertEqual(pricing.present(totals)['discount_percentage'], Decimal('16.66'))
+
+
+class CheckoutTests(CatalogTestCase):
+    """The customer's cart holds two units each of products 2, 3 (on sale) and 4."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def checkout(self):
+        return self.client.post(reverse('cart:create_order'), {
+            'shipping_address': 'Street 2',
+            'payment_method': 'Cash on Delivery',
+        })
+
+    def test_order_is_charged_the_displayed_total(self):
+        total = self.client.get(reverse('cart:cart_detail')).context['total']
+        self.assertEqual(total['subtotal'], Decimal('618.00'))
+        self.assertEqual(total['discount_total'], Decimal('26.00'))
+        self.assertEqual(total['total'], Decimal('592.00'))
+
+        response = self.checkout()
+        order = Order.objects.exclude(pk=self.order.pk).get()
+        self.assertRedirects(response, reverse('cart:order_confirmation', args=[order.pk]))
+        self.assertEqual(order.total_amount, total['total'])
+        items = {item.product_id: item for item in order.items.all()}
+        self.assertEqual(sum(item.total_price for item in items.values()), order.total_amount)
+        sale_item = items[self.products[3].pk]
+        self.assertEqual((sale_item.quantity, sale_item.price, sale_item.total_price), (2, Decimal('103.00'), Decimal('180.00')))
+
+    def test_checkout_takes_stock_and_empties_the_cart(self):
+        self.checkout()
+        self.products[2].refresh_from_db()
+        self.assertEqual(self.products[2].stock, 8)
+        self.assertEqual(self.client.get(reverse('cart:cart_length')).json()['cart_length'], 0)
+
+    def test_price_change_reprices_the_cart(self):
+        product = Product.objects.get(pk=self.products[2].pk)
+        product.price = Decimal('150.00')
+        product.save()
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.context['total']['total'], Decimal('688.00'))
+        self.assertIn('changed from Rs 102.00 to Rs 150.00', [str(message) for message in response.context['messages']][0])
+
+    def test_checkout_stops_at_a_price_change(self):
+        product = Product.objects.get(pk=self.products[3].pk)
+        product.on_sale = False
+        product.sale_price = None
+        product.save()
+
+        self.assertRedirects(self.checkout(), reverse('cart:cart_detail'))
+        self.assertFalse(Order.objects.exclude(pk=self.order.pk).exists())
+
+        # The cart now carries the new price, so the next attempt goes through.
+        self.checkout()
+        order = Order.objects.exclude(pk=self.order.pk).get()
+        self.assertEqual(order.total_amount, Decimal('618.00'))
+
+    def test_reconcile_ignores_saves_that_keep_the_price(self):
+        product = Product.objects.get(pk=self.products[4].pk)
+        product.stock = 3
+        product.save()
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(list(response.context['messages']), [])
+        self.assertEqual(response.context['total']['total'], Decimal('592.00'))
+
+    def test_checkout_charges_rows_changed_elsewhere(self):
+        # Totals seen by one request must not outlive a change made by another
+        # worker or the admin.
+        self.client.get(reverse('cart:cart_detail'))
+        CartLine.objects.filter(user=self.user, product=self.products[3]).update(quantity=3)
+
+        self.checkout()
+        order = Order.objects.exclude(pk=self.order.pk).get()
+        item = order.items.get(product=self.products[3])
+        self.assertEqual((item.quantity, item.total_price), (3, Decimal('270.00')))
+        self.assertEqual(order.total_amount, Decimal('682.00'))
+
+    def test_deleted_product_leaves_the_cart(self):
+        self.client.get(reverse('cart:cart_detail'))
+        Product.objects.filter(pk=self.products[4].pk).delete()
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.context['total']['total'], Decimal('384.00'))
+        self.assertEqual(len(response.context['cart']), 2)
+
+
+class CartOpsTests(CatalogTestCase):
+    """Batches sent to /cart/ops/ by the customer, whose cart holds products 2, 3 and 4."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def send(self, *ops):
+        return self.client.post(reverse('cart:cart_ops'), {'ops': list(ops)}, content_type='application/json')
+
+    def quantities(self):
+        return dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def test_batch_is_applied_and_state_returned(self):
+        first, second, third = self.products[2:5]
+        response = self.send(
+            {'op': 'add', 'product_id': first.pk, 'quantity': 1},
+            {'op': 'set', 'product_id': second.pk, 'quantity': 5},
+            {'op': 'set', 'product_id': third.pk, 'quantity': 0},
+            {'op': 'add', 'product_id': self.products[5].pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {first.pk: 3, second.pk: 5, self.products[5].pk: 1})
+        state = response.json()
+        self.assertIsNone(state['lines'][str(third.pk)])
+        self.assertEqual(state['lines'][str(second.pk)]['total_price'], '450.00')
+        self.assertEqual((state['cart_length'], state['cart_qty']), (3, 9))
+        self.assertEqual(state['totals']['total'], '861.00')
+
+    def test_batch_is_all_or_nothing(self):
+        before = self.quantities()
+        response = self.send(
+            {'op': 'remove', 'product_id': self.products[2].pk},
+            {'op': 'add', 'product_id': 999999},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', response.json()['error'])
+        self.assertEqual(self.quantities(), before)
+
+    def test_removing_a_missing_line_is_a_no_op(self):
+        before = self.quantities()
+        response = self.send({'op': 'remove', 'product_id': self.products[10].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['lines'][str(self.products[10].pk)])
+        self.assertEqual(self.quantities(), before)
+
+    def test_quantities_are_bounded(self):
+        product = self.products[2]
+        for op in (
+            {'op': 'set', 'product_id': product.pk, 'quantity': 10 ** 20},
+            {'op': 'add', 'product_id': 10 ** 20},
+            {'op': 'set', 'product_id': product.pk, 'quantity': 11},
+            {'op': 'add', 'product_id': product.pk, 'quantity': 9},
+        ):
+            with self.subTest(op):
+                self.assertEqual(self.send(op).status_code, 400)
+        self.assertEqual(self.quantities()[product.pk], 2)
+        self.assertEqual(self.send({'op': 'set', 'product_id': product.pk, 'quantity': 10}).status_code, 200)
+
+    def test_malformed_batches_are_rejected(self):
+        for body in ('not json', '{}', '{"ops": []}', '{"ops": [{"op": "zap", "product_id": 1}]}'):
+            with self.subTest(body):
+                response = self.client.post(reverse('cart:cart_ops'), body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class CartLengthTests(CatalogTestCase):
+    """The navbar badge endpoint, revalidated with If-None-Match."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_unchanged_cart_answers_304(self):
+        response = self.client.get(reverse('cart:cart_length'))
+        self.assertEqual(response.json(), {'cart_length': 3, 'cart_qty': 6})
+        self.assertIn('private', response['Cache-Control'])
+
+        revalidated = self.client.get(reverse('cart:cart_length'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_mutation_changes_the_tag(self):
+        etag = self.client.get(reverse('cart:cart_length'))['ETag']
+        self.client.post(reverse('cart:cart_ops'), {'ops': [{'op': 'add', 'product_id': self.products[2].pk}]},
+                         content_type='application/json')
+
+        response = self.client.get(reverse('cart:cart_length'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'cart_length': 3, 'cart_qty': 7})
+
+    def test_rows_changed_elsewhere_are_not_confirmed(self):
+        # Another worker (or the admin) removed a line: a 304 would keep the old count.
+        etag = self.client.get(reverse('cart:cart_length'))['ETag']
+        CartLine.objects.filter(user=self.user, product=self.products[2]).delete()
+
+        response = self.client.get(reverse('cart:cart_length'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'cart_length': 2, 'cart_qty': 4})
+
+    def test_add_to_cart_reports_the_new_counts(self):
+        response = self.client.post(reverse('cart:add_to_cart', args=[self.products[6].pk]), {'quantity': 2})
+        self.assertEqual((response.json()['cart_length'], response.json()['cart_qty']), (4, 8))
+
+
+class CartEndpointTests(CatalogTestCase):
+    """add_to_cart and update_cart enforce the same bounds as /cart/ops/."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def quantity(self, product):
+        return CartLine.objects.get(user=self.user, product=product).quantity
+
+    def test_add_to_cart_rejects_bad_quantities(self):
+        product = self.products[2]
+        for quantity in ('two', '0', '101', str(10 ** 20), '9'):
+            with self.subTest(quantity):
+                response = self.client.post(reverse('cart:add_to_cart', args=[product.pk]), {'quantity': quantity})
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantity(product), 2)
+        self.assertEqual(self.client.post(reverse('cart:add_to_cart', args=[product.pk]), {'quantity': 8}).status_code, 200)
+        self.assertEqual(self.quantity(product), 10)
+
+    def test_update_cart_steps_the_stored_line(self):
+        product = self.products[2]
+        url = reverse('cart:update_cart', args=[product.pk])
+        self.assertRedirects(self.client.post(url, {'action': 'add', 'quantity': 'junk'}), reverse('cart:cart_detail'))
+        self.assertEqual(self.quantity(product), 3)
+        self.client.post(url, {'action': 'subtract', 'quantity': '1'})
+        self.assertEqual(self.quantity(product), 2)
+        self.assertEqual(self.client.post(url, {'action': 'zap'}).status_code, 400)
+
+    def test_update_cart_stops_at_the_stock(self):
+        product = self.products[2]
+        CartLine.objects.filter(user=self.user, product=product).update(quantity=10)
+        response = self.client.post(reverse('cart:update_cart', args=[product.pk]), {'action': 'add'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantity(product), 10)
+
+    def test_subtracting_the_last_unit_removes_the_line(self):
+        product = self.products[2]
+        CartLine.objects.filter(user=self.user, product=product).update(quantity=1)
+        self.client.post(reverse('cart:update_cart', args=[product.pk]), {'action': 'subtract'})
+        self.assertFalse(CartLine.objects.filter(user=self.user, product=product).exists())
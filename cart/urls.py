@@ -9,6 +9,7 @@ urlpatterns = [
     path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/clear/', views.clear_cart, name='clear_cart'),
     path('cart/length/', views.cart_length, name='cart_length'),
+    path('ops/', views.cart_ops, name='cart_ops'),
     path('checkout/', views.create_order, name='create_order'),
     path('order-confirmation/<int:order_id>/', views.order_confirmation, name='order_confirmation'),
     path('order-detail/', views.order_detail, name='order_detail'),
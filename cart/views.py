@@ -1,44 +1,41 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from decimal import Decimal
+from django.views.decorators.http import require_POST
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.contrib import messages
-from ecommerce.models import Product, Review
+from ecommerce.models import Product
+from ecommerce import review_eligibility
 from .models import Order, OrderItem, Payment
-from .cart import Cart
+from .cart import CartOperationError, get_cart, max_quantity
+from . import pricing
+import json
 import logging
 
 
 
-def calculate_totals(cart):
-    subtotal = Decimal('0.00')
-    discount_total = Decimal('0.00')
-    discount_percentage = Decimal('0.00')
+def report_price_changes(request, changes):
+    """Tell the customer about lines whose charged amount changed; returns how many."""
+    reported = 0
+    for product, old, new in changes:
+        if product is None:
+            messages.warning(request, "A product in your cart is no longer available and was removed.")
+            reported += 1
+            continue
+        _, old_price = pricing.unit_cents(old.get('price'), old.get('sale_price'))
+        _, new_price = pricing.unit_cents(new['price'], new['sale_price'])
+        if old_price != new_price:
+            messages.warning(request, f"The price of {product.name} changed from Rs {pricing.from_cents(old_price)} to Rs {pricing.from_cents(new_price)}.")
+            reported += 1
+    return reported
 
-    for item in cart.values():
-        product_price = Decimal(item.get('price', '0.00'))
-        quantity = Decimal(item.get('quantity', 1))
-        subtotal += product_price * quantity
-
-        if item.get('sale_price') and Decimal(item['sale_price']) < product_price:
-            discount_total += (product_price - Decimal(item['sale_price'])) * quantity
-
-    if subtotal > 0:
-        discount_percentage = (discount_total / subtotal) * 100 
-        discount_percentage = round(discount_percentage, 2)
-
-    total = subtotal - discount_total
-    return {
-        'subtotal': subtotal,
-        'discount_total': discount_total,
-        'discount_percentage': discount_percentage,
-        'total': total,
-    }
 
 @login_required
 def cart_detail(request):
-    cart = Cart(request)
-    total = calculate_totals(cart.cart)
+    cart = get_cart(request)
+    report_price_changes(request, cart.reconcile())
+    total = cart.get_total_price()
 
     context = {
         "cart": cart,
@@ -50,21 +47,26 @@ def cart_detail(request):
 @login_required
 def add_to_cart(request, product_id):
     if request.method == "POST":
-        cart = Cart(request)
+        cart = get_cart(request)
         product = get_object_or_404(Product, id=product_id)
         quantity = request.POST.get("quantity", 1)
 
         try:
             quantity = int(quantity)
-            if quantity < 1:
-                raise ValueError("Quantity must be at least 1.")
+            if not 1 <= quantity <= max_quantity():
+                raise ValueError("Quantity out of range.")
         except ValueError:
             return JsonResponse({"error": "Invalid quantity"}, status=400)
 
-        cart.add(product=product, quantity=quantity)
+        try:
+            cart.apply([('add', product.id, quantity)])
+        except CartOperationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
+        summary = cart.summary()
         return JsonResponse({
-            "cart_qty": sum(item["quantity"] for item in cart.cart.values()),
+            "cart_qty": summary['quantity'],
+            "cart_length": summary['lines'],
             "message": "Product added to cart",
             "product_id": product.id,
             "product_name": product.name,
@@ -77,52 +79,141 @@ def add_to_cart(request, product_id):
 
 @login_required
 def remove_from_cart(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     return redirect('cart:cart_detail')  # Use the correct namespaced URL
 
 @login_required
 def clear_cart(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     cart.clear()
     return redirect('cart:cart_detail')  # Use the correct namespaced URL
 
 @login_required
 def cart_length(request):
-    cart = Cart(request)
-    cart_qty = len(cart.cart)
-    return JsonResponse({"cart_length": cart_qty})
+    # Counted from the database on every request, 304 or not, so every worker
+    # answers with the same tag and a 304 never confirms a stale count. The
+    # tag is made of the body's counters, so equal tags mean equal bodies.
+    summary = get_cart(request).summary()
+    etag = '"%s-%s-%s"' % (request.user.pk, summary['lines'], summary['quantity'])
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({"cart_length": summary['lines'], "cart_qty": summary['quantity']})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+def parse_operations(body):
+    """Validate {"ops": [{"op", "product_id", "quantity"}, ...]} into (op, product id, quantity) tuples."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise CartOperationError("The request body must be JSON.")
+    operations = data.get('ops') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError("Expected a non-empty list of operations in 'ops'.")
+    if len(operations) > getattr(settings, 'CART_OPS_MAX', 100):
+        raise CartOperationError("Too many operations.")
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise CartOperationError("Every operation must be an object.")
+        op = operation.get('op')
+        product_id = operation.get('product_id')
+        quantity = operation.get('quantity', 1 if op == 'add' else None)
+        if type(product_id) is not int or not 0 < product_id < 2 ** 63:
+            raise CartOperationError("Every operation needs an integer 'product_id'.")
+        if op == 'add' and (type(quantity) is not int or quantity < 1):
+            raise CartOperationError("'add' needs a quantity of at least 1.")
+        if op == 'set' and (type(quantity) is not int or quantity < 0):
+            raise CartOperationError("'set' needs a quantity of at least 0.")
+        if op not in ('add', 'set', 'remove'):
+            raise CartOperationError(f"Unknown operation {op!r}.")
+        if op != 'remove' and quantity > max_quantity():
+            raise CartOperationError(f"A line can hold at most {max_quantity()} units.")
+        parsed.append((op, product_id, quantity))
+    return parsed
+
+
+def cart_state(cart, product_ids):
+    """The given lines (None once removed), the totals and the badge count."""
+    totals = pricing.totals_for(cart)
+    lines = {}
+    for product_id in product_ids:
+        line = cart.cart.get(product_id)
+        if line is None:
+            lines[product_id] = None
+            continue
+        price, charged = pricing.unit_cents(line['price'], line['sale_price'])
+        lines[product_id] = {
+            'quantity': line['quantity'],
+            'price': pricing.from_cents(price),
+            'unit_price': pricing.from_cents(charged),
+            'total_price': pricing.from_cents(totals['lines'][product_id]),
+        }
+    summary = cart.summary()
+    return {
+        'lines': lines,
+        'totals': pricing.present(totals),
+        'cart_length': summary['lines'],
+        'cart_qty': summary['quantity'],
+    }
+
+
+@login_required
+@require_POST
+def cart_ops(request):
+    """Apply a batch of add/set/remove operations atomically and return the new cart state."""
+    cart = get_cart(request)
+    try:
+        touched = cart.apply(parse_operations(request.body))
+    except CartOperationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(cart_state(cart, touched))
 
 @login_required
 def update_cart(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
 
     if request.method == "POST":
+        # The stepper posts the quantity it displayed; the cart's own line is
+        # what gets stepped.
         action = request.POST.get("action")
-        quantity = int(request.POST.get("quantity", 0))
+        held = cart.cart.get(str(product.id), {}).get('quantity', 0)
 
         if action == "add":
-            cart.add(product, 1)
+            operation = ('add', product.id, 1)
         elif action == "subtract":
-            if quantity > 1:
-                cart.add(product, -1)
-            else:
-                cart.remove(product)
+            operation = ('set', product.id, max(held - 1, 0))
+        else:
+            return JsonResponse({"error": "Invalid action"}, status=400)
+        try:
+            cart.apply([operation])
+        except CartOperationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
     return redirect('cart:cart_detail')  
 
 @login_required
 def create_order(request):
-    cart = Cart(request) 
+    cart = get_cart(request) 
+
+    changed = report_price_changes(request, cart.reconcile())
 
     if request.method == 'POST':
+        if changed:
+            # Let the customer see the new amounts before they are charged.
+            return redirect('cart:cart_detail')
         shipping_address = request.POST.get('shipping_address')
         payment_method = request.POST.get('payment_method')
 
-        total_price_data = cart.get_total_price()  
-        total_amount = total_price_data['total']
+        # Charged from the lines loaded for this request, never from a memo.
+        totals = pricing.compute(cart.cart)
+        total_amount = pricing.from_cents(totals['total'])
 
         if shipping_address:  
             order = Order.objects.create(
@@ -133,11 +224,12 @@ def create_order(request):
                 payment_status='Pending'  
             )
             
-            for item in cart:
-                product = item['product']
+            products = cart.products()
+            for product_id, item in cart.cart.items():
+                product = products[int(product_id)]
                 quantity = item['quantity']
-                price = item['price']
-                total_price = item['total_price']
+                price = pricing.from_cents(item['price'])
+                total_price = pricing.from_cents(totals['lines'][product_id])
 
                 OrderItem.objects.create(
                     order=order,
@@ -148,7 +240,7 @@ def create_order(request):
                 )
 
                 product.stock -= quantity  
-                product.save()  
+                product.save(update_fields=['stock', 'availability', 'updated_at'])  
 
             Payment.objects.create(
                 order=order,
@@ -178,17 +270,15 @@ def order_confirmation(request, order_id):
 
 @login_required
 def order_detail(request):
-    pending_orders = Order.objects.filter(user=request.user, shipment_status='Pending').order_by('-created_at')
-    shipped_orders = Order.objects.filter(user=request.user, shipment_status='Shipped').order_by('-created_at')
+    pending_orders = Order.objects.filter(user=request.user, shipment_status='Pending').prefetch_related('items__product').order_by('-created_at')
+    shipped_orders = Order.objects.filter(user=request.user, shipment_status='Shipped').prefetch_related('items__product').order_by('-created_at')
     
-    delivered_orders = []
-    for order in Order.objects.filter(user=request.user, shipment_status='Delivered').order_by('-created_at'):
-        items_without_reviews = [
-            item for item in order.items.all()
-            if not Review.objects.filter(user=request.user, product=item.product).exists()
-        ]
-        if items_without_reviews:
-            delivered_orders.append(order)
+    eligible = review_eligibility.eligible_product_ids(request)
+    delivered_orders = [
+        order for order in Order.objects.filter(user=request.user, shipment_status='Delivered')
+        .prefetch_related('items__product').order_by('-created_at')
+        if any(item.product_id in eligible for item in order.items.all())
+    ]
     
     context = {
         'pending_orders': pending_orders,
@@ -198,5 +288,5 @@ def order_detail(request):
     return render(request, 'order_detail.html', context)
 @login_required
 def order_detail_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.prefetch_related('items__product'), id=order_id, user=request.user)
     return render(request, 'order_detail_view.html', {'order': order})
\ No newline at end of file
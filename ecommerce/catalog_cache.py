@@ -0,0 +1,91 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Category, Vendor, Offer, Product, Brand, Tag
+
+VERSION_KEY = 'catalog:version'
+
+_lock = threading.Lock()
+_snapshots = {}
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _load_offers():
+    # Date window is checked per request in active_offers(), so the snapshot
+    # only has to change when an offer row does.
+    return list(Offer.objects.filter(is_active=True, start_date__isnull=False, end_date__isnull=False))
+
+
+SECTIONS = {
+    'categories': lambda: list(Category.objects.all()),
+    'vendors': lambda: list(Vendor.objects.all()),
+    'brands': lambda: list(Brand.objects.all()),
+    'tags': lambda: list(Tag.objects.all()),
+    'offers': _load_offers,
+    'sale_products': lambda: list(Product.objects.filter(on_sale=True)),
+    'latest_products': lambda: list(Product.objects.order_by('-created_at')[:6]),
+    'trending_products': lambda: list(Product.objects.filter(on_sale=True).order_by('-view_count')[:6]),
+}
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version(**kwargs):
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def get_section(name, version=None):
+    if version is None:
+        version = get_version()
+    timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+    now = time.monotonic()
+
+    snapshot = _snapshots.get(name)
+    if snapshot and snapshot[0] == version and now - snapshot[1] < timeout:
+        _stats['hits'] += 1
+        return snapshot[2]
+
+    with _lock:
+        snapshot = _snapshots.get(name)
+        if snapshot and snapshot[0] == version and now - snapshot[1] < timeout:
+            _stats['hits'] += 1
+            return snapshot[2]
+        _stats['misses'] += 1
+        data = SECTIONS[name]()
+        _snapshots[name] = (version, time.monotonic(), data)
+        return data
+
+
+def active_offers(version=None):
+    now = timezone.now()
+    return [offer for offer in get_section('offers', version) if offer.start_date <= now <= offer.end_date]
+
+
+def clear():
+    with _lock:
+        _snapshots.clear()
+
+
+def stats():
+    hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'version': get_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'sections': sorted(_snapshots),
+    }
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Version keys bumped in one worker are only seen by the others through a shared cache."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_BACKENDS:
+        return [checks.Error(
+            "The default cache is local to each process, so catalog and review "
+            "page version bumps made in one worker are never seen by the others.",
+            hint="Point CACHES['default'] at a shared backend (file, Redis or Memcached).",
+            obj='CACHES',
+            id='ecommerce.E001',
+        )]
+    return []
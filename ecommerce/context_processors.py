@@ -1,18 +1,22 @@
-from django.utils import timezone
-from .models import Category, Vendor, Offer, Product, Brand
+from django.utils.functional import SimpleLazyObject
+from . import catalog_cache
+
 
 def global_context(request):
+    # Each section is only loaded when a template actually touches it, and is
+    # served from the per-worker catalog snapshot while the version holds.
+    version = SimpleLazyObject(lambda: {'value': catalog_cache.get_version()})
+
+    def section(name):
+        return SimpleLazyObject(lambda: catalog_cache.get_section(name, version['value']))
+
     context = {
-        'categories': Category.objects.all(),
-        'vendors': Vendor.objects.all(),
-        'brands' : Brand.objects.all(),
-        'offers': Offer.objects.filter(
-            is_active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        ),
-        'sale_products': Product.objects.filter(on_sale=True),
-        'latest_products': Product.objects.order_by('-created_at')[:5],
-        'trending_products': Product.objects.filter(on_sale=True).order_by('-view_count')[:5]
+        'categories': section('categories'),
+        'vendors': section('vendors'),
+        'brands': section('brands'),
+        'offers': SimpleLazyObject(lambda: catalog_cache.active_offers(version['value'])),
+        'sale_products': section('sale_products'),
+        'latest_products': section('latest_products'),
+        'trending_products': section('trending_products'),
     }
     return context
@@ -0,0 +1,161 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Product
+from . import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnStore:
+    """
+    Facet columns for the whole catalog, one compact array per attribute.
+
+    Row ``i`` of every column describes the product whose id is ``ids[i]``;
+    tags are stored CSR-style (``tag_offsets[i]:tag_offsets[i + 1]`` slices
+    ``tag_ids``). Missing brands are stored as 0.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.category_ids = array('q')
+        self.brand_ids = array('q')
+        self.on_sale = bytearray()
+        self.price_cents = array('q')
+        self.tag_offsets = array('q', [0])
+        self.tag_ids = array('q')
+        self.rows = {}
+
+    @classmethod
+    def build(cls):
+        store = cls()
+        product_tags = {}
+        for product_id, tag_id in Product.tag.through.objects.values_list('product_id', 'tag_id').order_by('product_id'):
+            product_tags.setdefault(product_id, []).append(tag_id)
+
+        products = Product.objects.values_list('id', 'category_id', 'brand_id', 'on_sale', 'price').order_by('id')
+        for product_id, category_id, brand_id, on_sale, price in products.iterator(chunk_size=2000):
+            store.rows[product_id] = len(store.ids)
+            store.ids.append(product_id)
+            store.category_ids.append(category_id)
+            store.brand_ids.append(brand_id or 0)
+            store.on_sale.append(1 if on_sale else 0)
+            store.price_cents.append(int(price * 100))
+            store.tag_ids.extend(product_tags.get(product_id, ()))
+            store.tag_offsets.append(len(store.tag_ids))
+        return store
+
+
+_lock = threading.Lock()
+_store = {'version': None, 'columns': None, 'rebuilding': False}
+
+
+def get_store():
+    """
+    The facet columns, built in the request only the first time.
+
+    After a catalog change the previous columns keep serving while a daemon
+    thread builds the new ones, so no search waits on a full catalog scan.
+    FACET_BACKGROUND_REBUILD = False rebuilds in the request instead.
+    """
+    version = catalog_cache.get_version()
+    with _lock:
+        if _store['columns'] is None:
+            _store['columns'] = ColumnStore.build()
+            _store['version'] = version
+        elif _store['version'] != version and not _store['rebuilding']:
+            if not getattr(settings, 'FACET_BACKGROUND_REBUILD', True):
+                _store['columns'], _store['version'] = ColumnStore.build(), version
+            else:
+                _store['rebuilding'] = True
+                threading.Thread(target=_rebuild, args=(version,), name='facet-rebuild', daemon=True).start()
+        return _store['columns']
+
+
+def _rebuild(version):
+    columns = None
+    try:
+        columns = ColumnStore.build()
+    except Exception:
+        # The previous columns keep serving; the next search retries.
+        logger.exception("Could not rebuild the facet column store")
+    finally:
+        connections.close_all()
+        with _lock:
+            _store['rebuilding'] = False
+            if columns is not None:
+                _store['columns'], _store['version'] = columns, version
+
+
+def clear():
+    with _lock:
+        _store['columns'] = _store['version'] = None
+
+
+def price_buckets():
+    return getattr(settings, 'FACET_PRICE_BUCKETS', [0, 50, 100, 250, 500, 1000])
+
+
+def compute(product_ids):
+    """Count categories, brands, tags, on-sale and price buckets for ``product_ids``."""
+    store = get_store()
+    edges = [int(Decimal(edge) * 100) for edge in price_buckets()]
+    categories = {}
+    brands = {}
+    tags = {}
+    histogram = [0] * len(edges)
+    on_sale = 0
+    total = 0
+
+    rows = store.rows
+    for product_id in product_ids:
+        row = rows.get(product_id)
+        if row is None:
+            continue
+        total += 1
+        category_id = store.category_ids[row]
+        categories[category_id] = categories.get(category_id, 0) + 1
+        brand_id = store.brand_ids[row]
+        if brand_id:
+            brands[brand_id] = brands.get(brand_id, 0) + 1
+        for tag_id in store.tag_ids[store.tag_offsets[row]:store.tag_offsets[row + 1]]:
+            tags[tag_id] = tags.get(tag_id, 0) + 1
+        on_sale += store.on_sale[row]
+        bucket = bisect_right(edges, store.price_cents[row]) - 1
+        if bucket >= 0:
+            histogram[bucket] += 1
+
+    return _label(total, categories, brands, tags, on_sale, histogram)
+
+
+def _label(total, categories, brands, tags, on_sale, histogram):
+    names = {
+        section: {item.id: item.name for item in catalog_cache.get_section(section)}
+        for section in ('categories', 'brands', 'tags')
+    }
+    edges = price_buckets()
+
+    def named(counts, section):
+        facet = [{'id': key, 'name': names[section].get(key, ''), 'count': count} for key, count in counts.items()]
+        return sorted(facet, key=lambda item: (-item['count'], item['name']))
+
+    price = []
+    for position, count in enumerate(histogram):
+        upper = edges[position + 1] if position + 1 < len(edges) else None
+        label = f'{edges[position]}+' if upper is None else f'{edges[position]}-{upper}'
+        price.append({'min': edges[position], 'max': upper, 'label': label, 'count': count})
+
+    return {
+        'total': total,
+        'categories': named(categories, 'categories'),
+        'brands': named(brands, 'brands'),
+        'tags': named(tags, 'tags'),
+        'on_sale': on_sale,
+        'price': price,
+    }
@@ -0,0 +1,34 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Kept free of Django imports: render() runs in worker processes started with
+# the "spawn" method, which import this module from scratch.
+
+
+def render(data, widths, quality=80):
+    """
+    Resize the image in ``data`` to each of ``widths`` (never upscaling) and
+    encode every size as WebP plus a JPEG fallback, or PNG when the image has
+    transparency. Returns ``(width, height, format, bytes)`` tuples.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = 'png' if has_alpha else 'jpeg'
+    results = []
+    for width in sorted({min(width, image.width) for width in widths}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in ('webp', fallback):
+            out = io.BytesIO()
+            if fmt == 'png':
+                resized.save(out, 'PNG', optimize=True)
+            elif fmt == 'jpeg':
+                resized.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                resized.save(out, 'WEBP', quality=quality, method=4)
+            results.append((width, height, fmt, out.getvalue()))
+    return results
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import renditions
+
+
+class Command(BaseCommand):
+    help = "Render thumbnail and WebP renditions for every stored image that lacks them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-render images that already have renditions.")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--prune', action='store_true', help="Also delete renditions of images no longer in use.")
+
+    def handle(self, *args, **options):
+        images, written = renditions.backfill(force=options['force'], batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(f"Rendered {written} renditions for {images} images.")
+        if options['prune']:
+            self.stdout.write(f"Pruned {renditions.prune()} unused renditions.")
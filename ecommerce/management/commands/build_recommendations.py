@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.recommendations import build_neighbors
+
+
+class Command(BaseCommand):
+    help = "Rebuild the item-to-item co-purchase neighbour table used for recommendations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, default=None, help="Neighbours kept per product (defaults to RECOMMENDATION_NEIGHBORS).")
+        parser.add_argument('--max-basket', type=int, default=None, help="Most recent products per customer (defaults to RECOMMENDATION_MAX_BASKET).")
+
+    def handle(self, *args, **options):
+        products, rows = build_neighbors(options['neighbors'], options['max_basket'])
+        self.stdout.write(f"Stored {rows} neighbours for {products} products.")
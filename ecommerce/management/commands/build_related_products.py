@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import related
+from ecommerce.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored related-products list for every product."
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        for start in range(0, len(product_ids), 200):
+            related.refresh(product_ids[start:start + 200])
+        self.stdout.write(f"Refreshed related products for {len(product_ids)} products.")
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.view_counter import drain_spool, flush_interval
+
+
+class Command(BaseCommand):
+    help = "Apply buffered product view counts from the view counter spool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', default=None, help="Spool directory (defaults to VIEW_COUNTER_SPOOL_DIR).")
+        parser.add_argument('--loop', action='store_true', help="Keep draining every VIEW_COUNTER_FLUSH_INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        directory = options['spool_dir'] or getattr(settings, 'VIEW_COUNTER_SPOOL_DIR', None)
+        if not directory:
+            raise CommandError("No spool directory configured; in-memory counters are flushed by each worker.")
+
+        while True:
+            applied = drain_spool(directory)
+            self.stdout.write(f"Applied {applied} product views.")
+            if not options['loop']:
+                break
+            time.sleep(flush_interval())
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed media blobs that no model field references."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be removed.")
+        parser.add_argument('--grace-period', type=int, default=None,
+                            help="Keep blobs younger than this many seconds (default MEDIA_GC_GRACE_PERIOD).")
+
+    def handle(self, *args, **options):
+        removed, freed = collect_garbage(dry_run=options['dry_run'], grace_period=options['grace_period'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(f"{verb} {removed} blobs ({freed} bytes).")
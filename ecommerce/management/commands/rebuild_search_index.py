@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch."
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(f"Indexed {count} products using the {search.get_backend().name} backend.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import review_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized review aggregates on every product from the Review table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help="Only repair these products.")
+
+    def handle(self, *args, **options):
+        changed = review_stats.recompute(options['product_ids'] or None)
+        self.stdout.write(f"Repaired review aggregates on {changed} products.")
@@ -0,0 +1,76 @@
+import re
+
+from django.conf import settings
+
+from .storage import blob_prefix
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Image renditions: <name>.<12 hex digest>.<width>w.<ext>
+RENDITION_RE = re.compile(r'\.[0-9a-f]{12}\.\d+w\.\w+$')
+
+
+def serve_mode():
+    """'django' (FileResponse), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)."""
+    return getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+
+
+def is_immutable(path):
+    """Content-hashed names never change content, so they can be cached forever."""
+    return path.startswith(blob_prefix() + '/') or bool(RENDITION_RE.search(path))
+
+
+def cache_control(path):
+    if is_immutable(path):
+        return 'public, max-age=31536000, immutable'
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte range, end inclusive, asked for by a
+    single-range ``Range`` header. None means serve the whole file (no or
+    unsupported header); ValueError means the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range.")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range starts past the end of the file.")
+    return start, end
+
+
+class RangeFile:
+    """
+    Read-only view of ``length`` bytes of ``file`` starting at ``start``.
+
+    It deliberately has no fileno(), so WSGI servers stream it through read()
+    instead of sending the file from its current offset to the end.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
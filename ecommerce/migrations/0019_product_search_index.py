@@ -0,0 +1,64 @@
+import html
+
+from django.db import migrations
+from django.db.utils import OperationalError
+from django.utils.html import strip_tags
+
+# Frozen copies of ecommerce.search as of this migration, so later changes to
+# the search code don't alter what this migration does.
+FTS_TABLE = 'ecommerce_product_fts'
+FIELDS = ('name', 'description', 'brand', 'tags')
+
+CREATE_FTS_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, brand, tags, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def product_document(product):
+    return {
+        'name': product.name,
+        'description': ' '.join(html.unescape(strip_tags(product.description or '')).split()),
+        'brand': product.brand.name if product.brand_id else '',
+        'tags': ' '.join(tag.name for tag in product.tag.all()),
+    }
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_FTS_TABLE_SQL)
+    except OperationalError:
+        # SQLite built without FTS5; search falls back to the in-memory index.
+        return
+
+    Product = apps.get_model('ecommerce', 'Product')
+    rows = [
+        [product.id] + [document[field] for field in FIELDS]
+        for product in Product.objects.select_related('brand').prefetch_related('tag')
+        for document in [product_document(product)]
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELDS)}) VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0018_category_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
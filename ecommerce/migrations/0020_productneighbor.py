@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0019_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ecommerce.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='ecommerce.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-score'], name='ecommerce_neighbor_rank_idx')],
+                'unique_together': {('product', 'neighbor')},
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:18
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_review_stats(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    Review = apps.get_model('ecommerce', 'Review')
+    counts = defaultdict(dict)
+    for product_id, rating, count in Review.objects.values_list('product_id', 'rating').annotate(count=Count('id')).order_by():
+        counts[product_id][rating] = count
+
+    products = []
+    for product in Product.objects.filter(id__in=list(counts)):
+        ratings = counts[product.id]
+        product.review_count = sum(ratings.values())
+        product.review_sum = sum(rating * count for rating, count in ratings.items())
+        product.rating_average = product.review_sum / product.review_count
+        for rating in range(1, 6):
+            setattr(product, f'rating_{rating}', ratings.get(rating, 0))
+        products.append(product)
+    Product.objects.bulk_update(
+        products,
+        ['review_count', 'review_sum', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0021_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
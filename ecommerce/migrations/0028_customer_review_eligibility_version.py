@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0027_product_price_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='review_eligibility_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
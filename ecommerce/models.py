@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -17,6 +17,8 @@ class Customer(TimeStampedModel):
     city = models.CharField(max_length=100, blank=True)
     phone_number = models.CharField(max_length=15, blank=True)
     postal_code = models.CharField(max_length=20, blank=True)
+    # Moves when an order is delivered or a review written (review_eligibility).
+    review_eligibility_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
@@ -78,17 +80,74 @@ class Product(TimeStampedModel):
     on_sale = models.BooleanField(default=False)
     color = models.CharField(max_length=50, blank=True)  
 
+    # Review aggregates, kept in step with Review rows by ecommerce.review_stats.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    review_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0.0, editable=False)
+
+    # Bumped whenever a pricing field changes; carts remember the version
+    # they priced a line at and re-price only lines that are behind.
+    price_version = models.PositiveIntegerField(default=1, editable=False)
+
+    PRICE_FIELDS = ('price', 'sale_price', 'on_sale')
+    # Maintained with F() updates; a full save of a stale instance must not
+    # write them back.
+    COUNTER_FIELDS = (
+        'view_count', 'review_count', 'review_sum',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5', 'rating_average',
+    )
+
+    class Meta:
+        # Listing sort keys; keyset pages are range scans over these.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='ecommerce_product_newest_idx'),
+            models.Index(fields=['price', 'id'], name='ecommerce_product_price_idx'),
+            models.Index(fields=['-view_count', 'id'], name='ecommerce_product_popular_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='ecommerce_product_cat_idx'),
+            models.Index(fields=['brand', '-created_at', '-id'], name='ecommerce_product_brand_idx'),
+            models.Index(fields=['vendor', '-created_at', '-id'], name='ecommerce_product_vendor_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can tell which fields changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
         if self.stock <= 0:
             self.availability = 'unavailable'
             self.stock = 0  
         else:
             self.availability = 'available'
+        loaded = getattr(self, '_loaded_values', {})
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        if 'price_version' in loaded and (update_fields is None or 'price_version' in update_fields):
+            if any(field in loaded and loaded[field] != getattr(self, field) for field in self.PRICE_FIELDS):
+                self.price_version += 1
         super(Product, self).save(*args, **kwargs)
+        loaded = getattr(self, '_loaded_values', {})
+        if loaded:
+            loaded.update({field: getattr(self, field) for field in self.PRICE_FIELDS + ('price_version',) if field in loaded})
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        return [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+
 
 class Offer(models.Model):
     title = models.CharField(max_length=255, help_text="Title or description of the offer")
@@ -114,6 +173,94 @@ class Review(models.Model):
     rating = models.PositiveIntegerField()  
     review_text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    helpful_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='ecommerce_review_newest_idx'),
+            models.Index(fields=['product', '-helpful_count', '-created_at', '-id'], name='ecommerce_review_helpful_idx'),
+            models.Index(fields=['product', '-rating', '-created_at', '-id'], name='ecommerce_review_rating_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The product's review aggregates are updated by a post_save handler;
+        # the transaction keeps the review and the aggregates in step.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user.username}'s review on {self.product.name}"
+
+class ReviewVote(models.Model):
+    review = models.ForeignKey(Review, related_name='votes', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('review', 'user')
+
+    def __str__(self):
+        return f"{self.user_id} found review {self.review_id} helpful"
+
+
+class ProductNeighbor(models.Model):
+    product = models.ForeignKey(Product, related_name='neighbors', on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'neighbor')
+        indexes = [models.Index(fields=['product', '-score'], name='ecommerce_neighbor_rank_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(Product, related_name='related', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'related')
+        indexes = [models.Index(fields=['product', '-score'], name='ecommerce_related_rank_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class ImageRendition(models.Model):
+    source = models.CharField(max_length=255, db_index=True)
+    source_hash = models.CharField(max_length=64)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source', 'width', 'format')
+
+    def __str__(self):
+        return self.name
+
+
+class MediaBlob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username}'s review on {self.product.name}"
\ No newline at end of file
+        return f"{self.name} ({self.ref_count} refs)"
@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import re
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import catalog_cache
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_cacheable_request(request):
+    """Anonymous GET/HEAD without cookies other than the CSRF cookie."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if set(request.COOKIES) - {settings.CSRF_COOKIE_NAME}:
+        return False
+    return not request.user.is_authenticated
+
+
+def make_key(path, params, version=None):
+    if version is None:
+        version = catalog_cache.get_version()
+    digest = hashlib.md5(f'{path}?{urlencode(sorted(params))}'.encode()).hexdigest()
+    return f'page:{version}:{digest}'
+
+
+def invalidate_path(path):
+    """Drop the cached page for ``path`` (without query string) at the current version."""
+    cache.delete(make_key(path, []))
+
+
+def _store(key, response, last_modified, csrf):
+    body = response.content
+    entry = {
+        'body': gzip.compress(body),
+        'content_type': response['Content-Type'],
+        'etag': '"%s"' % hashlib.md5(body).hexdigest(),
+        'last_modified': int(last_modified.timestamp()) if last_modified else int(time.time()),
+        'csrf': csrf,
+    }
+    cache.set(key, entry, _setting('PAGE_CACHE_TIMEOUT', 300))
+    return entry
+
+
+def _serve(request, entry):
+    if entry['csrf']:
+        # The page posts with the CSRF cookie; make sure this client gets one.
+        get_token(request)
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        if ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')):
+            response = HttpResponse(entry['body'], content_type=entry['content_type'])
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(entry['body']), content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ('Cookie', 'Accept-Encoding', 'X-Requested-With'))
+    return response
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + _setting('PAGE_CACHE_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def anonymous_page_cache(last_modified=None, query_params=(), on_hit=None):
+    """
+    Cache the rendered page for anonymous, cookie-less requests.
+
+    Entries are keyed on the catalog version, the path and the listed query
+    parameters, stored gzip-compressed, and served with an ETag (a hash of
+    the body) and a Last-Modified from ``last_modified(request, **kwargs)`` so
+    revalidations get a 304. Concurrent misses for one key render once: the
+    first request takes a lock and the others wait briefly for its entry.
+    ``on_hit(request, **kwargs)`` runs for requests answered from the cache,
+    for side effects such as view counting.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+
+            params = [(name, request.GET[name]) for name in query_params if request.GET.get(name)]
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                # Listings answer their infinite-scroll fetches with JSON.
+                params.append(('_xhr', '1'))
+            key = make_key(request.path, params)
+            entry = cache.get(key)
+            if entry is None:
+                lock_key = f'{key}:lock'
+                if cache.add(lock_key, 1, _setting('PAGE_CACHE_LOCK_TIMEOUT', 10)):
+                    try:
+                        return _render(request, key, view_func, args, kwargs)
+                    finally:
+                        cache.delete(lock_key)
+                entry = _wait_for(key)
+                if entry is None:
+                    return view_func(request, *args, **kwargs)
+
+            if on_hit is not None:
+                on_hit(request, **kwargs)
+            return _serve(request, entry)
+
+        def _render(request, key, view_func, args, kwargs):
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            stamp = last_modified(request, **kwargs) if last_modified else None
+            entry = _store(key, response, stamp, bool(request.META.get('CSRF_COOKIE_NEEDS_UPDATE')))
+            return _serve(request, entry)
+
+        return wrapper
+    return decorator
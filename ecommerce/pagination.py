@@ -0,0 +1,160 @@
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import catalog_cache
+
+CURSOR_SALT = 'ecommerce.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _field_name(field):
+    return field.lstrip('-')
+
+
+def _json_value(value):
+    # Decimals and datetimes go through str(); model fields parse them back
+    # when the cursor values are used in lookups.
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def encode_cursor(ordering, row):
+    values = [_json_value(row[_field_name(field)]) for field in ordering]
+    return signing.dumps({'o': list(ordering), 'v': values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, ordering):
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor("Malformed cursor.")
+    if data.get('o') != list(ordering) or len(data.get('v', ())) != len(ordering):
+        raise InvalidCursor("Cursor does not match the requested ordering.")
+    return data['v']
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "strictly after this row" condition for ``ordering``, e.g.
+    ``['-price', 'id']`` gives ``price < p OR (price = p AND id > i)``.
+    """
+    after = Q(pk__in=[])
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = _field_name(field)
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        after |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return after
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    """Order ``queryset`` by ``ordering`` and start it after ``cursor``."""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, ordering)))
+    return queryset
+
+
+def page_size_from(request, default, maximum):
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def cursor_row(obj, ordering):
+    return {_field_name(field): getattr(obj, _field_name(field)) for field in ordering}
+
+
+class KeysetPage:
+    """One page of a listing: its items, the cursor of the next page and a total."""
+
+    def __init__(self, items, next_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=24):
+    """Fetch one page after ``cursor``; one extra row tells whether more follow."""
+    rows = list(keyset_queryset(queryset, ordering, cursor)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(ordering, cursor_row(rows[-1], ordering))
+    return KeysetPage(rows, next_cursor)
+
+
+def _is_after(ordering, row, values):
+    for field, value, cursor_value in zip(ordering, row, values):
+        if value != cursor_value:
+            return value < cursor_value if field.startswith('-') else value > cursor_value
+    return False
+
+
+def ids_page(ids, queryset, ordering, cursor=None, page_size=24, annotations=None):
+    """
+    Page through a cached, already ordered id list. The cursor ends with the
+    id of the last row served, so its position in ``ids`` is where the page
+    starts; if that row has left the list, fall back to a keyset query over
+    ``queryset`` with the sort values the cursor carries.
+
+    ``annotations`` ({field: {id: value}}) holds sort values computed outside
+    the database, such as a search rank. They are set on the items, and a
+    cursor over them is resumed by comparing in Python instead of a query.
+    """
+    annotations = annotations or {}
+    start = 0
+    if cursor:
+        values = decode_cursor(cursor, ordering)
+        try:
+            start = ids.index(values[-1]) + 1
+        except (ValueError, TypeError):
+            start = None
+        names = [_field_name(field) for field in ordering]
+        if start is None and all(name in annotations or name == 'id' for name in names):
+            def row(product_id):
+                return [product_id if name == 'id' else annotations[name].get(product_id) for name in names]
+            start = next((position for position, product_id in enumerate(ids)
+                          if _is_after(ordering, row(product_id), values)), len(ids))
+    if start is None:
+        page_ids = list(keyset_queryset(queryset, ordering, cursor).values_list('id', flat=True)[:page_size + 1])
+    else:
+        page_ids = list(ids[start:start + page_size + 1])
+
+    has_more = len(page_ids) > page_size
+    page_ids = page_ids[:page_size]
+    objects = queryset.in_bulk(page_ids)
+    items = [objects[product_id] for product_id in page_ids if product_id in objects]
+    for name, values_by_id in annotations.items():
+        for item in items:
+            setattr(item, name, values_by_id.get(item.pk))
+    next_cursor = encode_cursor(ordering, cursor_row(items[-1], ordering)) if has_more and items else None
+    return KeysetPage(items, next_cursor, len(ids))
+
+
+def estimated_count(key, queryset):
+    """
+    COUNT(*) of ``queryset``, run once per catalog version and cached for
+    LISTING_COUNT_TIMEOUT seconds; listings show it as an approximate total.
+    """
+    cache_key = f'count:{catalog_cache.get_version()}:{key}'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(cache_key, count, getattr(settings, 'LISTING_COUNT_TIMEOUT', 600))
+    return count
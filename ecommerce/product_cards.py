@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+
+from . import renditions
+
+TEMPLATE = 'costumer/product_card.html'
+VARIANTS = ('grid', 'carousel', 'trending', 'sale')
+
+
+def discount_percentage(product):
+    if product.on_sale and product.price and product.sale_price and product.price > 0:
+        return round((product.price - product.sale_price) / product.price * 100, 2)
+    return None
+
+
+def make_key(product, variant, image_version):
+    stamp = product.updated_at.timestamp() if product.updated_at else 0
+    return f'card:{variant}:{product.pk}:{stamp}:{image_version}'
+
+
+class ProductCardCache:
+    """
+    Rendered product cards keyed by (id, updated_at, variant).
+
+    A bounded per-process LRU sits in front of the shared cache; a listing
+    fetches all of its cards from the shared cache with one get_many and
+    renders (and stores with one set_many) only the ones missing there. The
+    renditions version is part of the key, so cards pick up new srcsets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _max_entries(self):
+        return getattr(settings, 'PRODUCT_CARD_CACHE_SIZE', 2000)
+
+    def _remember(self, items):
+        with self._lock:
+            for key, html in items.items():
+                self._entries[key] = html
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries():
+                self._entries.popitem(last=False)
+
+    def render(self, product, variant):
+        return get_template(TEMPLATE).render({
+            'product': product,
+            'variant': variant,
+            'discount': discount_percentage(product),
+        })
+
+    def get_many(self, products, variant='grid'):
+        """Return {product id: html} for ``products``."""
+        image_version = renditions.get_version()
+        keys = {make_key(product, variant, image_version): product for product in products}
+        found = {}
+        with self._lock:
+            for key in keys:
+                html = self._entries.get(key)
+                if html is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = html
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = cache.get_many(missing)
+            rendered = {key: self.render(keys[key], variant) for key in missing if key not in shared}
+            if rendered:
+                cache.set_many(rendered, getattr(settings, 'PRODUCT_CARD_CACHE_TIMEOUT', 3600))
+            self._remember({**shared, **rendered})
+            found.update(shared)
+            found.update(rendered)
+        return {product.pk: found[key] for key, product in keys.items()}
+
+    def get(self, product, variant='grid'):
+        return self.get_many([product], variant)[product.pk]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+product_cards = ProductCardCache()
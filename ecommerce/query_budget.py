@@ -0,0 +1,149 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Literals and IN lists are replaced so queries that differ only in their
+# parameters share one shape.
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|NULL)\s*,?)+\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize(sql):
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper counting the queries, their time and their shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[normalize(sql)] += 1
+
+    def suspects(self, threshold):
+        """Shapes run at least ``threshold`` times: likely per-row (N+1) queries."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def budget_for(view_name):
+    budgets = _setting('QUERY_BUDGETS', {})
+    return budgets.get(view_name, _setting('QUERY_BUDGET_DEFAULT', None))
+
+
+def record(view_name, recorder, suspects, over_budget):
+    with _lock:
+        entry = _stats.setdefault(view_name, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_time': 0.0,
+            'over_budget': 0,
+            'suspects': Counter(),
+        })
+        entry['requests'] += 1
+        entry['queries'] += recorder.count
+        entry['max_queries'] = max(entry['max_queries'], recorder.count)
+        entry['db_time'] += recorder.duration
+        entry['over_budget'] += over_budget
+        for shape, count in suspects:
+            entry['suspects'][shape] += count
+
+
+def stats():
+    with _lock:
+        views = {}
+        for view_name, entry in _stats.items():
+            requests = entry['requests']
+            views[view_name] = {
+                'requests': requests,
+                'avg_queries': round(entry['queries'] / requests, 2),
+                'max_queries': entry['max_queries'],
+                'avg_db_ms': round(entry['db_time'] * 1000 / requests, 3),
+                'budget': budget_for(view_name),
+                'over_budget': entry['over_budget'],
+                'n_plus_one_suspects': [
+                    {'sql': shape, 'count': count} for shape, count in entry['suspects'].most_common(5)
+                ],
+            }
+    return dict(sorted(views.items(), key=lambda item: -item[1]['avg_queries']))
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the database queries each view makes and check them against
+    QUERY_BUDGETS (keyed by URL name, QUERY_BUDGET_DEFAULT otherwise).
+
+    A SQL shape repeated QUERY_BUDGET_REPEAT_THRESHOLD times in one request
+    is reported as an N+1 suspect. Over-budget requests are logged, or raise
+    QueryBudgetExceeded when QUERY_BUDGET_RAISE is set (ECOM.test_settings
+    sets it). Queries run while a streaming response is consumed are not seen.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('QUERY_BUDGET_ENABLED', True):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match and match.view_name else request.path
+        suspects = recorder.suspects(_setting('QUERY_BUDGET_REPEAT_THRESHOLD', 5))
+        budget = budget_for(view_name)
+        over_budget = budget is not None and recorder.count > budget
+        record(view_name, recorder, suspects, over_budget)
+
+        for shape, count in suspects:
+            logger.warning("Possible N+1 in %s: %d× %s", view_name, count, shape)
+        if over_budget:
+            message = "%s made %d queries (%.1f ms), budget is %d" % (
+                view_name, recorder.count, recorder.duration * 1000, budget)
+            if _setting('QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,123 @@
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from cart.models import OrderItem
+from .models import Product, ProductNeighbor
+
+VERSION_KEY = 'recommendations:version'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def build_neighbors(neighbors=None, max_basket=None):
+    """
+    Compute item-item cosine similarity from co-purchases and store the top
+    ``neighbors`` per product.
+
+    Each customer's purchase history is one basket (capped to the
+    ``max_basket`` most recent products so heavy buyers don't dominate or blow
+    up the pair count). Pair counts are accumulated in a sparse dict-of-dicts
+    and normalized by ``sqrt(buyers(i) * buyers(j))``.
+    """
+    neighbors = neighbors or _setting('RECOMMENDATION_NEIGHBORS', 20)
+    max_basket = max_basket or _setting('RECOMMENDATION_MAX_BASKET', 100)
+
+    baskets = defaultdict(list)
+    rows = (
+        OrderItem.objects.order_by('order__user_id', '-order__created_at')
+        .values_list('order__user_id', 'product_id')
+    )
+    for user_id, product_id in rows.iterator(chunk_size=5000):
+        basket = baskets[user_id]
+        if product_id not in basket and len(basket) < max_basket:
+            basket.append(product_id)
+
+    buyers = defaultdict(int)
+    pairs = defaultdict(lambda: defaultdict(int))
+    for basket in baskets.values():
+        for product_id in basket:
+            buyers[product_id] += 1
+        for position, first in enumerate(basket):
+            for second in basket[position + 1:]:
+                pairs[first][second] += 1
+                pairs[second][first] += 1
+
+    rows = []
+    for product_id, counts in pairs.items():
+        scored = sorted(
+            ((count / math.sqrt(buyers[product_id] * buyers[other]), other) for other, count in counts.items()),
+            reverse=True,
+        )
+        rows.extend(
+            ProductNeighbor(product_id=product_id, neighbor_id=other, score=score)
+            for score, other in scored[:neighbors]
+        )
+
+    with transaction.atomic():
+        ProductNeighbor.objects.all().delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=1000)
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    return len(pairs), len(rows)
+
+
+def _recent_purchases(user, limit):
+    recent = []
+    rows = OrderItem.objects.filter(order__user=user).order_by('-order__created_at').values_list('product_id', flat=True)
+    for product_id in rows[:limit * 4]:
+        if product_id not in recent:
+            recent.append(product_id)
+            if len(recent) == limit:
+                break
+    return recent
+
+
+def recommend_ids(user, limit=None):
+    """
+    Merge the neighbour lists of the user's most recent purchases.
+
+    More recent purchases count more (halving weight per position), products
+    the user already bought are skipped, and the list is topped up with the
+    most viewed products from the purchased categories when neighbours run
+    short (e.g. before build_recommendations has run).
+    """
+    limit = limit or _setting('RECOMMENDATION_LIMIT', 12)
+    recent = _recent_purchases(user, _setting('RECOMMENDATION_RECENT_PURCHASES', 10))
+    if not recent:
+        return []
+
+    weights = {product_id: 0.5 ** position for position, product_id in enumerate(recent)}
+    scores = defaultdict(float)
+    rows = ProductNeighbor.objects.filter(product_id__in=recent).values_list('product_id', 'neighbor_id', 'score')
+    for product_id, neighbor_id, score in rows:
+        if neighbor_id not in weights:
+            scores[neighbor_id] += weights[product_id] * score
+
+    ids = [product_id for product_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+    if len(ids) < limit:
+        ids += list(
+            Product.objects.filter(category__in=Product.objects.filter(id__in=recent).values('category'))
+            .exclude(id__in=recent + ids)
+            .order_by('-view_count', 'id')
+            .values_list('id', flat=True)[:limit - len(ids)]
+        )
+    return ids
+
+
+def recommended_products(user):
+    """Return the cached, bounded recommendation list for ``user``."""
+    key = f'recommendations:{cache.get(VERSION_KEY, 0)}:{user.pk}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = recommend_ids(user)
+        cache.set(key, ids, _setting('RECOMMENDATION_CACHE_TIMEOUT', 600))
+    if not ids:
+        return []
+    products = Product.objects.in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
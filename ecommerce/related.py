@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Product, ProductNeighbor, RelatedProduct
+
+CATEGORY_WEIGHT = 1.0
+BRAND_WEIGHT = 2.0
+TAG_WEIGHT = 0.5
+CO_PURCHASE_WEIGHT = 3.0
+
+
+def stored_count():
+    return getattr(settings, 'RELATED_PRODUCTS_STORED', 12)
+
+
+def score_candidates(product):
+    """
+    Score other products against ``product``: shared category and brand,
+    one point per shared tag, and the co-purchase similarity from
+    ProductNeighbor. Only the RELATED_PRODUCTS_CANDIDATES most viewed
+    attribute matches are considered.
+    """
+    scores = defaultdict(float)
+    pool = getattr(settings, 'RELATED_PRODUCTS_CANDIDATES', 500)
+
+    match = Q(category_id=product.category_id)
+    if product.brand_id:
+        match |= Q(brand_id=product.brand_id)
+    candidates = (
+        Product.objects.filter(match).exclude(id=product.id)
+        .order_by('-view_count', 'id')
+        .values_list('id', 'category_id', 'brand_id')[:pool]
+    )
+    for candidate_id, category_id, brand_id in candidates:
+        if category_id == product.category_id:
+            scores[candidate_id] += CATEGORY_WEIGHT
+        if product.brand_id and brand_id == product.brand_id:
+            scores[candidate_id] += BRAND_WEIGHT
+
+    tag_ids = list(product.tag.values_list('id', flat=True))
+    if tag_ids:
+        shared = (
+            Product.tag.through.objects.filter(tag_id__in=tag_ids)
+            .exclude(product_id=product.id)
+            .values_list('product_id', flat=True)
+        )
+        for candidate_id in shared[:pool * 4]:
+            scores[candidate_id] += TAG_WEIGHT
+
+    neighbors = ProductNeighbor.objects.filter(product=product).values_list('neighbor_id', 'score')
+    for candidate_id, score in neighbors:
+        scores[candidate_id] += CO_PURCHASE_WEIGHT * score
+
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:stored_count()]
+
+
+def refresh(product_ids):
+    """Recompute and store the related list of each product in ``product_ids``."""
+    products = Product.objects.filter(id__in=list(product_ids)).only('id', 'category_id', 'brand_id')
+    for product in products:
+        rows = [
+            RelatedProduct(product=product, related_id=related_id, score=score)
+            for related_id, score in score_candidates(product)
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product=product).delete()
+            RelatedProduct.objects.bulk_create(rows)
+
+
+def refresh_around(product_id):
+    """
+    Refresh ``product_id`` and every product currently listing it, which is
+    what changes when its category, brand or tags move. Products that would
+    newly list it are picked up by the next build_related_products run.
+    """
+    listing = set(RelatedProduct.objects.filter(related_id=product_id).values_list('product_id', flat=True))
+    refresh(listing | {product_id})
+
+
+def related_products(product, limit=4):
+    """
+    Serve the precomputed list with one indexed lookup. The list is only
+    written by the save signals and build_related_products; until a product
+    has one, its category's most viewed products stand in.
+    """
+    rows = list(RelatedProduct.objects.filter(product=product).select_related('related').order_by('-score')[:limit])
+    if rows:
+        return [row.related for row in rows]
+    return list(
+        Product.objects.filter(category_id=product.category_id).exclude(id=product.id)
+        .order_by('-view_count', 'id')[:limit]
+    )
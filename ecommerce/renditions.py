@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from .imaging import render
+from .models import Product, Category, Brand, Offer, Vendor, ImageRendition
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'renditions:version'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+
+# Uploads to these fields get renditions.
+IMAGE_FIELDS = [
+    (Product, 'product_image'),
+    (Category, 'image'),
+    (Brand, 'image'),
+    (Offer, 'banner'),
+    (Vendor, 'profile_picture'),
+]
+
+_lock = threading.Lock()
+_executors = {}
+_manifest = {'version': None, 'sources': {}}
+
+
+def widths():
+    return getattr(settings, 'IMAGE_RENDITION_WIDTHS', [160, 320, 640, 1280])
+
+
+def quality():
+    return getattr(settings, 'IMAGE_RENDITION_QUALITY', 80)
+
+
+def process_pool():
+    """Pillow work runs in a shared pool of spawned worker processes."""
+    with _lock:
+        if 'process' not in _executors:
+            _executors['process'] = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', None),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executors['process']
+
+
+def _background():
+    with _lock:
+        if 'thread' not in _executors:
+            _executors['thread'] = ThreadPoolExecutor(max_workers=2, thread_name_prefix='renditions')
+        return _executors['thread']
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def rendition_name(source, digest, width, fmt):
+    root, _ = os.path.splitext(source)
+    return f'{root}.{digest[:12]}.{width}w.{EXTENSIONS[fmt]}'
+
+
+def store(storage, source, digest, results):
+    """Save rendered files beside ``source`` and replace its ImageRendition rows."""
+    # Renditions already stored for these bytes keep their files. The rows
+    # are checked rather than the storage: under ContentAddressedStorage the
+    # saved name is the blob's, never the rendition name asked for.
+    existing = {
+        (width, fmt): name
+        for width, fmt, name in ImageRendition.objects.filter(source=source, source_hash=digest)
+        .values_list('width', 'format', 'name')
+    }
+    rows = []
+    for width, height, fmt, data in results:
+        name = existing.get((width, fmt))
+        if name is None:
+            name = rendition_name(source, digest, width, fmt)
+            # Names are content-hashed, so an existing file already has these bytes.
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(data))
+        rows.append(ImageRendition(source=source, source_hash=digest, width=width, height=height, format=fmt, name=name))
+    with transaction.atomic():
+        ImageRendition.objects.filter(source=source).delete()
+        ImageRendition.objects.bulk_create(rows)
+    transaction.on_commit(bump_version)
+    return len(rows)
+
+
+def _read(storage, source):
+    with storage.open(source, 'rb') as image:
+        data = image.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _is_current(source, digest):
+    return ImageRendition.objects.filter(source=source, source_hash=digest).exists()
+
+
+def generate(storage, source, force=False):
+    """Render and store the renditions of one image; returns how many were written."""
+    data, digest = _read(storage, source)
+    if not force and _is_current(source, digest):
+        return 0
+    results = process_pool().submit(render, data, widths(), quality()).result()
+    return store(storage, source, digest, results)
+
+
+def _generate_in_background(storage, source):
+    try:
+        generate(storage, source)
+    except Exception:
+        logger.exception("Could not render image renditions for %s", source)
+    finally:
+        close_old_connections()
+
+
+def schedule(field_file):
+    """Generate renditions for a freshly saved upload without blocking the request."""
+    if field_file and field_file.name:
+        _background().submit(_generate_in_background, field_file.storage, field_file.name)
+
+
+def iter_sources():
+    """Every (storage, name) referenced by an image field, without duplicates."""
+    seen = set()
+    for model, field_name in IMAGE_FIELDS:
+        storage = model._meta.get_field(field_name).storage
+        names = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        for name in names.values_list(field_name, flat=True).iterator():
+            if name not in seen:
+                seen.add(name)
+                yield storage, name
+
+
+def backfill(force=False, batch_size=32, stdout=None):
+    """
+    Render every image that has no current renditions, ``batch_size`` images
+    at a time across the process pool. Returns (images, renditions) written.
+    """
+    pool = process_pool()
+    images = renditions = 0
+    sources = iter_sources()
+    while True:
+        batch = []
+        for storage, source in sources:
+            try:
+                data, digest = _read(storage, source)
+            except OSError as e:
+                if stdout:
+                    stdout.write(f"Skipping {source}: {e}")
+                continue
+            if force or not _is_current(source, digest):
+                batch.append((storage, source, digest, data))
+            if len(batch) == batch_size:
+                break
+        if not batch:
+            return images, renditions
+
+        futures = {pool.submit(render, data, widths(), quality()): (storage, source, digest) for storage, source, digest, data in batch}
+        for future in as_completed(futures):
+            storage, source, digest = futures[future]
+            try:
+                renditions += store(storage, source, digest, future.result())
+                images += 1
+            except Exception as e:
+                if stdout:
+                    stdout.write(f"Skipping {source}: {e}")
+
+
+def prune():
+    """Delete renditions whose source image is no longer referenced."""
+    referenced = {name for _, name in iter_sources()}
+    stale = ImageRendition.objects.exclude(source__in=referenced)
+    storage = Product._meta.get_field('product_image').storage
+    removed = 0
+    for rendition in stale.iterator():
+        storage.delete(rendition.name)
+        removed += 1
+    stale.delete()
+    bump_version()
+    return removed
+
+
+def manifest():
+    """Per-process map of source name to its (width, format, name) renditions."""
+    version = get_version()
+    with _lock:
+        if _manifest['version'] != version:
+            sources = defaultdict(list)
+            rows = ImageRendition.objects.order_by('source', 'width').values_list('source', 'width', 'format', 'name')
+            for source, width, fmt, name in rows.iterator(chunk_size=5000):
+                sources[source].append((width, fmt, name))
+            _manifest['sources'] = dict(sources)
+            _manifest['version'] = version
+        return _manifest['sources']
+
+
+def renditions_for(source, request=None):
+    # The manifest version is checked once per request, not once per image.
+    sources = getattr(request, '_renditions_manifest', None)
+    if sources is None:
+        sources = manifest()
+        if request is not None:
+            request._renditions_manifest = sources
+    return sources.get(source, [])
@@ -0,0 +1,113 @@
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from . import catalog_cache
+
+ENTRY_OVERHEAD = 256
+
+
+def canonical_price(value):
+    value = (value or '').strip()
+    if not value:
+        return ''
+    try:
+        return str(Decimal(value).normalize())
+    except InvalidOperation:
+        return value
+
+
+def canonical_query(value):
+    return ' '.join((value or '').lower().split())
+
+
+def make_key(kind, **params):
+    return (kind,) + tuple(sorted(params.items()))
+
+
+class ResultCache:
+    """
+    LRU of ordered product-id lists keyed by canonicalized filter parameters.
+
+    Ids are kept in compact ``array('q')`` buffers so one entry serves every
+    page size. Entries expire after RESULT_CACHE_TIMEOUT seconds, are dropped
+    when the catalog version changes, and the least recently used ones are
+    evicted once RESULT_CACHE_MAX_BYTES is exceeded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_size(self, key, ids):
+        return ids.itemsize * len(ids) + sys.getsizeof(key) + ENTRY_OVERHEAD
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[3]
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, expires, ids, size = entry
+            if entry_version != version or expires <= time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ids
+
+    def set(self, key, version, ids):
+        ids = array('q', ids)
+        size = self._entry_size(key, ids)
+        max_bytes = getattr(settings, 'RESULT_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+        if size > max_bytes:
+            return ids
+        timeout = getattr(settings, 'RESULT_CACHE_TIMEOUT', 120)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, time.monotonic() + timeout, ids, size)
+            self._size += size
+            while self._size > max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return ids
+
+    def get_or_set(self, key, compute):
+        version = catalog_cache.get_version()
+        ids = self.get(key, version)
+        if ids is None:
+            ids = self.set(key, version, compute())
+        return ids
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,60 @@
+from django.db.models import F
+
+from cart.models import OrderItem
+from .models import Customer, Review
+
+SESSION_KEY = 'review_eligibility'
+
+
+def get_version(user_id):
+    """The version stored on the user's Customer row; None when there is none."""
+    return Customer.objects.filter(user_id=user_id).values_list('review_eligibility_version', flat=True).first()
+
+
+def bump_version(user_id):
+    Customer.objects.filter(user_id=user_id).update(review_eligibility_version=F('review_eligibility_version') + 1)
+
+
+def load(user):
+    """Product ids ``user`` received in a delivered order and has not reviewed yet."""
+    return set(
+        OrderItem.objects.filter(
+            order__user=user,
+            order__user__customer__isnull=False,
+            order__shipment_status='Delivered',
+        )
+        .exclude(product_id__in=Review.objects.filter(user=user).values('product_id'))
+        .values_list('product_id', flat=True)
+        .distinct()
+    )
+
+
+def eligible_product_ids(request):
+    """
+    The user's eligibility set, kept in the session and reloaded only when
+    the version on their Customer row moves (an order is delivered or a
+    review written), so a bump made by any worker is seen by all of them.
+    Memoized on the request so repeated checks cost nothing.
+    """
+    if not request.user.is_authenticated:
+        return frozenset()
+    memo = getattr(request, '_review_eligibility', None)
+    if memo is not None:
+        return memo
+
+    version = get_version(request.user.pk)
+    stored = request.session.get(SESSION_KEY)
+    if version is None:
+        # Only customers can review.
+        ids = frozenset()
+    elif stored and stored.get('version') == version:
+        ids = frozenset(stored['ids'])
+    else:
+        ids = frozenset(load(request.user))
+        request.session[SESSION_KEY] = {'version': version, 'ids': sorted(ids)}
+    request._review_eligibility = ids
+    return ids
+
+
+def can_review(request, product_id):
+    return product_id in eligible_product_ids(request)
@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Product, Review
+
+RATING_FIELDS = {rating: f'rating_{rating}' for rating in range(1, 6)}
+STATS_FIELDS = ['review_count', 'review_sum', *RATING_FIELDS.values(), 'rating_average']
+
+
+def apply(product_id, added=None, removed=None):
+    """
+    Move a product's aggregates by one review added and/or removed, in a
+    single UPDATE built from F() expressions so concurrent reviews don't
+    overwrite each other.
+    """
+    count_delta = 0
+    sum_delta = 0
+    histogram = defaultdict(int)
+    for rating, sign in ((added, 1), (removed, -1)):
+        if rating is None:
+            continue
+        count_delta += sign
+        sum_delta += sign * rating
+        if rating in RATING_FIELDS:
+            histogram[RATING_FIELDS[rating]] += sign
+
+    updates = {field: F(field) + delta for field, delta in histogram.items() if delta}
+    if count_delta:
+        updates['review_count'] = F('review_count') + count_delta
+    if sum_delta:
+        updates['review_sum'] = F('review_sum') + sum_delta
+    if not updates:
+        return
+
+    # SET expressions see the old row, so the new average uses the deltas.
+    updates['rating_average'] = Case(
+        When(review_count=-count_delta, then=Value(0.0)),
+        default=Cast(F('review_sum') + sum_delta, FloatField()) / (F('review_count') + count_delta),
+        output_field=FloatField(),
+    )
+    Product.objects.filter(id=product_id).update(**updates)
+
+
+def stats_from_counts(counts):
+    """Aggregate fields for a ``{rating: count}`` mapping."""
+    review_count = sum(counts.values())
+    review_sum = sum(rating * count for rating, count in counts.items())
+    values = {
+        'review_count': review_count,
+        'review_sum': review_sum,
+        'rating_average': review_sum / review_count if review_count else 0.0,
+    }
+    for rating, field in RATING_FIELDS.items():
+        values[field] = counts.get(rating, 0)
+    return values
+
+
+def recompute(product_ids=None):
+    """Rebuild the aggregates from the Review table; returns products updated."""
+    counts = defaultdict(dict)
+    reviews = Review.objects.all()
+    products = Product.objects.only('id', *STATS_FIELDS)
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        products = products.filter(id__in=product_ids)
+    for product_id, rating, count in reviews.values_list('product_id', 'rating').annotate(count=Count('id')).order_by():
+        counts[product_id][rating] = count
+
+    changed = []
+    for product in products.iterator(chunk_size=1000):
+        values = stats_from_counts(counts.get(product.id, {}))
+        if any(getattr(product, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(product, field, value)
+            changed.append(product)
+    Product.objects.bulk_update(changed, STATS_FIELDS, batch_size=500)
+    return len(changed)
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .models import Review, ReviewVote
+from .page_cache import invalidate_path
+from .pagination import keyset_page
+
+# Every ordering ends in (created_at, id) so it is total and matches one of
+# the Review indexes with the product id as the leading column.
+REVIEW_ORDERINGS = {
+    'newest': ['-created_at', '-id'],
+    'helpful': ['-helpful_count', '-created_at', '-id'],
+    'rating': ['-rating', '-created_at', '-id'],
+}
+DEFAULT_ORDERING = 'newest'
+REVIEW_FIELDS = ['id', 'rating', 'review_text', 'created_at', 'helpful_count', 'user__username']
+
+
+def page_size():
+    return getattr(settings, 'REVIEW_PAGE_SIZE', 10)
+
+
+def max_page_size():
+    return getattr(settings, 'REVIEW_MAX_PAGE_SIZE', 50)
+
+
+def ordering_for(name):
+    return REVIEW_ORDERINGS.get(name) or REVIEW_ORDERINGS[DEFAULT_ORDERING]
+
+
+def review_page(product_id, order_by=DEFAULT_ORDERING, cursor=None, size=None):
+    """
+    Return one page of a product's reviews and the cursor for the next one.
+
+    Authors come in with the same query, so a page costs a single indexed
+    range scan however many reviews the product has.
+    """
+    ordering = ordering_for(order_by)
+    size = size or page_size()
+    queryset = Review.objects.filter(product_id=product_id).select_related('user').only(*REVIEW_FIELDS)
+    page = keyset_page(queryset, ordering, cursor, size)
+    return page.items, page.next_cursor
+
+
+def serialize(review):
+    return {
+        'id': review.id,
+        'username': review.user.username,
+        'rating': review.rating,
+        'review_text': review.review_text,
+        'created_at': review.created_at,
+        'helpful_count': review.helpful_count,
+    }
+
+
+def _first_page_key(product_id, order_by):
+    return f'reviews:first:{product_id}:{order_by}'
+
+
+def first_page(product_id, order_by=DEFAULT_ORDERING):
+    """Rendered first page of reviews and its next cursor, cached per product."""
+    if order_by not in REVIEW_ORDERINGS:
+        order_by = DEFAULT_ORDERING
+    key = _first_page_key(product_id, order_by)
+    cached = cache.get(key)
+    if cached is None:
+        reviews, next_cursor = review_page(product_id, order_by)
+        cached = {
+            'html': render_to_string('costumer/detail/review_list.html', {'reviews': reviews}),
+            'next_cursor': next_cursor,
+        }
+        cache.set(key, cached, getattr(settings, 'REVIEW_CACHE_TIMEOUT', 600))
+    return cached
+
+
+def invalidate(product_id):
+    cache.delete_many([_first_page_key(product_id, order_by) for order_by in REVIEW_ORDERINGS])
+    invalidate_path(reverse('product_detail', args=[product_id]))
+
+
+def mark_helpful(review, user):
+    """Record one helpful vote per user; returns False if ``user`` already voted."""
+    try:
+        with transaction.atomic():
+            ReviewVote.objects.create(review=review, user=user)
+            Review.objects.filter(pk=review.pk).update(helpful_count=F('helpful_count') + 1)
+    except IntegrityError:
+        return False
+    transaction.on_commit(lambda: invalidate(review.product_id))
+    return True
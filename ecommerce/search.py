@@ -0,0 +1,265 @@
+import html
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import strip_tags
+
+from .models import Product
+
+FTS_TABLE = 'ecommerce_product_fts'
+FIELDS = ('name', 'description', 'brand', 'tags')
+FIELD_WEIGHTS = {'name': 10.0, 'description': 1.0, 'brand': 5.0, 'tags': 3.0}
+TOKEN_RE = re.compile(r'\w+')
+
+CREATE_FTS_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, brand, tags, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def plain_text(value):
+    return ' '.join(html.unescape(strip_tags(value or '')).split())
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def product_document(product):
+    return {
+        'name': product.name,
+        'description': plain_text(product.description),
+        'brand': product.brand.name if product.brand_id else '',
+        'tags': ' '.join(tag.name for tag in product.tag.all()),
+    }
+
+
+def iter_documents(queryset):
+    products = queryset.select_related('brand').prefetch_related('tag')
+    for product in products.iterator(chunk_size=500):
+        yield product.id, product_document(product)
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+
+class FTS5Backend:
+    name = 'fts5'
+
+    def _match_expression(self, query):
+        # Every term is quoted (so user input can't inject FTS syntax) and
+        # prefix-matched, which keeps as-you-type queries useful.
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, query, limit):
+        match = self._match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY score DESC LIMIT %s",
+                [match, limit],
+            )
+            return cursor.fetchall()
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+    def index(self, documents):
+        documents = list(documents)
+        self.remove(product_id for product_id, _ in documents)
+        rows = [[product_id] + [document[field] for field in FIELDS] for product_id, document in documents]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELDS)}) VALUES (%s, %s, %s, %s, %s)",
+                    rows,
+                )
+
+    def rebuild(self, documents):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        count = 0
+        batch = []
+        for item in documents:
+            batch.append(item)
+            if len(batch) >= 500:
+                self.index(batch)
+                count += len(batch)
+                batch = []
+        self.index(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        return count + len(batch)
+
+
+class InvertedIndex:
+    """In-memory BM25 index used when SQLite's FTS5 is not available."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0.0
+        self._vocabulary = None
+
+    def add(self, product_id, document):
+        self.remove(product_id)
+        terms = Counter()
+        for field in FIELDS:
+            for token in tokenize(document[field]):
+                terms[token] += FIELD_WEIGHTS[field]
+        for term, frequency in terms.items():
+            self.postings[term][product_id] = frequency
+        self.doc_terms[product_id] = list(terms)
+        self.doc_lengths[product_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[product_id]
+        self._vocabulary = None
+
+    def remove(self, product_id):
+        for term in self.doc_terms.pop(product_id, ()):
+            postings = self.postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(product_id, 0.0)
+        self._vocabulary = None
+
+    def _expand(self, token):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect_left(self._vocabulary, token)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens or not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        average_length = self.total_length / doc_count
+
+        scores = None
+        for token in tokens:
+            token_scores = defaultdict(float)
+            for term in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[product_id] / average_length)
+                    token_scores[product_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+class InMemoryBackend:
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._built_at = 0.0
+
+    def _get_index(self):
+        interval = getattr(settings, 'SEARCH_FALLBACK_REBUILD_INTERVAL', 300)
+        with self._lock:
+            # Signals only reach this process, so other workers' edits are
+            # picked up by a periodic rebuild.
+            if self._index is None or time.monotonic() - self._built_at >= interval:
+                index = InvertedIndex()
+                for product_id, document in iter_documents(Product.objects.all()):
+                    index.add(product_id, document)
+                self._index = index
+                self._built_at = time.monotonic()
+            return self._index
+
+    def search(self, query, limit):
+        return self._get_index().search(query, limit)
+
+    def remove(self, product_ids):
+        with self._lock:
+            if self._index is not None:
+                for product_id in product_ids:
+                    self._index.remove(product_id)
+
+    def index(self, documents):
+        with self._lock:
+            if self._index is not None:
+                for product_id, document in documents:
+                    self._index.add(product_id, document)
+
+    def rebuild(self, documents):
+        index = InvertedIndex()
+        for product_id, document in documents:
+            index.add(product_id, document)
+        with self._lock:
+            self._index = index
+            self._built_at = time.monotonic()
+        return len(index.doc_lengths)
+
+
+_fts5_backend = FTS5Backend()
+_memory_backend = InMemoryBackend()
+_fts5_available = None
+
+
+def fts5_available():
+    global _fts5_available
+    if _fts5_available is None:
+        _fts5_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts5_available
+
+
+def get_backend():
+    if getattr(settings, 'SEARCH_BACKEND', 'auto') != 'memory' and fts5_available():
+        return _fts5_backend
+    return _memory_backend
+
+
+def search(query, limit=None):
+    """Return ``[(product_id, score), ...]`` ordered by BM25 relevance."""
+    return get_backend().search(query, limit or max_results())
+
+
+def index_products(product_ids):
+    get_backend().index(iter_documents(Product.objects.filter(id__in=list(product_ids))))
+
+
+def remove_products(product_ids):
+    get_backend().remove(list(product_ids))
+
+
+def rebuild():
+    return get_backend().rebuild(iter_documents(Product.objects.all()))
@@ -0,0 +1,147 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.urls import reverse
+from cart.models import Order
+from .models import Category, Vendor, Brand, Offer, Product, Tag, Review
+from . import catalog_cache, related, renditions, review_eligibility, review_stats, reviews, search
+from .page_cache import invalidate_path
+
+# Fields a checkout writes; only the product's own page shows them.
+STOCK_FIELDS = ('stock', 'availability', 'updated_at')
+
+
+for model in (Category, Vendor, Brand, Offer, Tag):
+    post_save.connect(catalog_cache.bump_version, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+for model in (Category, Vendor, Brand, Offer, Product, Tag):
+    post_delete.connect(catalog_cache.bump_version, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
+m2m_changed.connect(catalog_cache.bump_version, sender=Product.tag.through, dispatch_uid='catalog_version_product_tags')
+
+
+def touches(update_fields, *fields):
+    # Saves limited to update_fields (stock changes at checkout) skip work
+    # that depends on other fields.
+    return update_fields is None or not update_fields.isdisjoint(fields)
+
+
+@receiver(post_save, sender=Product, dispatch_uid='catalog_version_save_Product')
+def bump_catalog_version(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and update_fields <= set(STOCK_FIELDS):
+        # A stock change leaves listings, facets and results as they were.
+        invalidate_path(reverse('product_detail', args=[instance.pk]))
+    else:
+        catalog_cache.bump_version()
+
+
+@receiver(post_save, sender=Product, dispatch_uid='search_index_product_save')
+def index_saved_product(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, 'name', 'description', 'brand'):
+        search.index_products([instance.id])
+
+
+@receiver(post_save, sender=Product, dispatch_uid='related_products_product_save')
+def refresh_related_products(sender, instance, created, update_fields=None, **kwargs):
+    if not touches(update_fields, 'category', 'brand'):
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or any(loaded.get(field) != getattr(instance, field) for field in ('category_id', 'brand_id')):
+        transaction.on_commit(lambda: related.refresh_around(instance.id))
+    instance._loaded_values = dict(loaded, category_id=instance.category_id, brand_id=instance.brand_id)
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='search_index_product_delete')
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.remove_products([instance.id])
+
+
+@receiver(post_save, sender=Brand, dispatch_uid='search_index_brand_save')
+def reindex_brand_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag, dispatch_uid='search_index_tag_save')
+def reindex_tag_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag, dispatch_uid='search_index_tag_pre_delete')
+def remember_tag_products(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag, dispatch_uid='search_index_tag_delete')
+def reindex_untagged_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(m2m_changed, sender=Product.tag.through, dispatch_uid='search_index_product_tags')
+def reindex_retagged_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_products([instance.id])
+        transaction.on_commit(lambda: related.refresh_around(instance.id))
+    elif action == 'post_clear':
+        search.index_products(getattr(instance, '_search_product_ids', []))
+    elif pk_set:
+        search.index_products(pk_set)
+
+
+@receiver(post_save, sender=Review, dispatch_uid='review_pages_review_save')
+def invalidate_review_pages(sender, instance, **kwargs):
+    product_ids = {instance.product_id, getattr(instance, '_loaded_values', {}).get('product_id', instance.product_id)}
+
+    def invalidate():
+        for product_id in product_ids:
+            reviews.invalidate(product_id)
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=Review, dispatch_uid='review_pages_review_delete')
+def invalidate_deleted_review_pages(sender, instance, **kwargs):
+    transaction.on_commit(lambda: reviews.invalidate(instance.product_id))
+
+
+@receiver(post_save, sender=Review, dispatch_uid='review_stats_review_save')
+def update_review_stats(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    if created:
+        review_stats.apply(instance.product_id, added=instance.rating)
+    elif not loaded:
+        # Saved without being loaded first, so the previous rating is unknown.
+        review_stats.recompute([instance.product_id])
+    elif loaded.get('product_id', instance.product_id) != instance.product_id:
+        review_stats.apply(loaded['product_id'], removed=loaded.get('rating'))
+        review_stats.apply(instance.product_id, added=instance.rating)
+    elif loaded.get('rating') != instance.rating:
+        review_stats.apply(instance.product_id, added=instance.rating, removed=loaded.get('rating'))
+    instance._loaded_values = dict(loaded, product_id=instance.product_id, rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review, dispatch_uid='review_stats_review_delete')
+def remove_review_stats(sender, instance, **kwargs):
+    review_stats.apply(instance.product_id, removed=instance.rating)
+
+
+@receiver(post_save, sender=Order, dispatch_uid='review_eligibility_order_save')
+@receiver(post_save, sender=Review, dispatch_uid='review_eligibility_review_save')
+@receiver(post_delete, sender=Review, dispatch_uid='review_eligibility_review_delete')
+def refresh_review_eligibility(sender, instance, **kwargs):
+    transaction.on_commit(lambda: review_eligibility.bump_version(instance.user_id))
+
+
+def render_uploaded_image(field_name):
+    def handler(sender, instance, **kwargs):
+        field_file = getattr(instance, field_name)
+        if field_file and field_file.name and not renditions.renditions_for(field_file.name):
+            transaction.on_commit(lambda: renditions.schedule(field_file))
+    return handler
+
+
+for model, field_name in renditions.IMAGE_FIELDS:
+    post_save.connect(render_uploaded_image(field_name), sender=model, weak=False,
+                      dispatch_uid=f'renditions_{model.__name__}')
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models
+from django.db.models import F
+
+
+def blob_prefix():
+    return getattr(settings, 'CONTENT_STORAGE_PREFIX', 'blobs')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of each distinct upload.
+
+    Uploads are hashed (SHA-256) while being streamed to a temporary file and
+    then moved to ``<prefix>/ab/cd/<digest><ext>``; if that blob already
+    exists the copy is dropped and the existing blob is reused. The returned
+    name is the blob name, so URLs never change for a given content and can be
+    cached forever. MediaBlob rows count the references handed out;
+    ``collect_garbage`` removes blobs that no model field points at any more.
+    Names outside the prefix (files stored before this backend) behave as
+    with FileSystemStorage.
+    """
+
+    def is_blob(self, name):
+        return name.startswith(blob_prefix() + '/')
+
+    def blob_name(self, digest, ext):
+        return f'{blob_prefix()}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+    def _save(self, name, content):
+        temp_dir = self.path(os.path.join(blob_prefix(), 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            blob = self.blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            full_path = self.path(blob)
+            if os.path.exists(full_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._add_reference(digest.hexdigest(), blob, size)
+        return blob
+
+    def _add_reference(self, digest, name, size):
+        from .models import MediaBlob
+
+        blob, created = MediaBlob.objects.get_or_create(digest=digest, defaults={'name': name, 'size': size, 'ref_count': 1})
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    def delete(self, name):
+        # A blob may back other fields, so deleting only drops a reference;
+        # collect_garbage removes the file once nothing points at it.
+        if not self.is_blob(name):
+            return super().delete(name)
+        from .models import MediaBlob
+
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+def referenced_names():
+    """Count how often every stored name is referenced by a file field or rendition."""
+    from .models import ImageRendition
+
+    counts = Counter()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                names = model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                counts.update(names.values_list(field.name, flat=True).iterator())
+    counts.update(ImageRendition.objects.values_list('name', flat=True).iterator())
+    return counts
+
+
+def collect_garbage(storage=None, dry_run=False, grace_period=None):
+    """
+    Reconcile MediaBlob reference counts with the database and delete blobs
+    nothing references. Blobs and temporary files younger than
+    ``grace_period`` seconds are kept, since their referencing row may not be
+    committed yet. Returns (blobs removed, bytes freed).
+    """
+    from .models import MediaBlob
+
+    storage = storage or default_storage
+    if grace_period is None:
+        grace_period = getattr(settings, 'MEDIA_GC_GRACE_PERIOD', 3600)
+    cutoff = time.time() - grace_period
+    references = referenced_names()
+    removed = freed = 0
+
+    def is_old(name):
+        try:
+            return os.path.getmtime(storage.path(name)) < cutoff
+        except FileNotFoundError:
+            return True
+
+    known = set()
+    for blob in MediaBlob.objects.iterator():
+        known.add(blob.name)
+        refs = references.get(blob.name, 0)
+        if refs:
+            if blob.ref_count != refs and not dry_run:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=refs)
+        elif is_old(blob.name):
+            removed += 1
+            freed += blob.size
+            if not dry_run:
+                if storage.exists(blob.name):
+                    os.remove(storage.path(blob.name))
+                blob.delete()
+
+    # Files left behind by a save that failed before its MediaBlob row was written.
+    root = storage.path(blob_prefix())
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known or references.get(name) or os.path.getmtime(path) >= cutoff:
+                continue
+            removed += 1
+            freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+    return removed, freed
@@ -0,0 +1,170 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Product, Brand, Category
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+SHORT_PREFIX = 2
+
+
+def max_limit():
+    return getattr(settings, 'SUGGEST_MAX_LIMIT', 10)
+
+
+def _normalize(label):
+    return ' '.join(tokenize(label))
+
+
+class SuggestIndex:
+    """
+    Sorted-array prefix index over suggestion labels.
+
+    Every word position of a label is a key (so "m4" finds "BMW M4"), keys
+    are kept sorted for bisect lookups, and the top entries for one- and
+    two-character prefixes are precomputed because those ranges are huge.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        pairs = []
+        for ref, entry in entries.items():
+            tokens = _normalize(entry['label']).split()
+            for position in range(len(tokens)):
+                pairs.append((' '.join(tokens[position:]), ref))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.refs = [ref for _, ref in pairs]
+
+        short = {}
+        for key, ref in pairs:
+            for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                short.setdefault(key[:length], set()).add(ref)
+        self.short = {prefix: self._top(refs, max_limit()) for prefix, refs in short.items()}
+
+    def _top(self, refs, limit):
+        return heapq.nlargest(limit, refs, key=lambda ref: (self.entries[ref]['weight'], -ref[1]))
+
+    def lookup(self, prefix, limit):
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            refs = self.short.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+            refs = self._top(set(self.refs[start:end]), limit)
+        return [
+            {key: self.entries[ref][key] for key in ('type', 'id', 'label', 'url')}
+            for ref in refs
+        ]
+
+
+def _product_entry(product_id, name, weight):
+    return {'type': 'product', 'id': product_id, 'label': name, 'weight': weight,
+            'url': reverse('product_detail', args=[product_id])}
+
+
+def load_entries(since=None):
+    """Build suggestion entries, optionally only for rows updated after ``since``."""
+    sales_weight = getattr(settings, 'SUGGEST_SALES_WEIGHT', 10)
+    products = Product.objects.annotate(sales=Sum('orderitem__quantity', default=0))
+    brands = Brand.objects.annotate(weight=Sum('product__view_count', default=0))
+    categories = Category.objects.annotate(weight=Sum('product__view_count', default=0))
+    if since is not None:
+        products = products.filter(updated_at__gt=since)
+        brands = brands.filter(updated_at__gt=since)
+        categories = categories.filter(updated_at__gt=since)
+
+    limit = getattr(settings, 'SUGGEST_MAX_PRODUCTS', 50000)
+    entries = {}
+    rows = products.order_by('-view_count').values_list('id', 'name', 'view_count', 'sales')[:limit]
+    for product_id, name, view_count, sales in rows:
+        entries[('product', product_id)] = _product_entry(product_id, name, view_count + sales_weight * sales)
+    for brand_id, name, weight in brands.values_list('id', 'name', 'weight'):
+        entries[('brand', brand_id)] = {'type': 'brand', 'id': brand_id, 'label': name, 'weight': weight,
+                                       'url': reverse('brand_products', args=[brand_id])}
+    for category_id, name, weight in categories.values_list('id', 'name', 'weight'):
+        entries[('category', category_id)] = {'type': 'category', 'id': category_id, 'label': name, 'weight': weight,
+                                             'url': reverse('category_detail', args=[category_id])}
+    return entries
+
+
+class Suggester:
+    """
+    Per-process autocomplete over product, brand and category names.
+
+    The index is built on first use and then maintained by a daemon thread:
+    every SUGGEST_REFRESH_INTERVAL seconds rows whose ``updated_at`` moved
+    past the watermark are merged in, and every SUGGEST_REBUILD_INTERVAL the
+    index is rebuilt to drop deletions and pick up new view/sales weights.
+    Lookups never touch the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._watermark = None
+        self._built_at = 0.0
+        self._refresher = None
+
+    def rebuild(self):
+        watermark = timezone.now()
+        index = SuggestIndex(load_entries())
+        with self._lock:
+            self._index, self._watermark, self._built_at = index, watermark, time.monotonic()
+        return index
+
+    def refresh(self):
+        rebuild_interval = getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 3600)
+        if self._index is None or time.monotonic() - self._built_at >= rebuild_interval:
+            return self.rebuild()
+        watermark = timezone.now()
+        changed = load_entries(since=self._watermark)
+        if changed:
+            entries = dict(self._index.entries)
+            entries.update(changed)
+            index = SuggestIndex(entries)
+            with self._lock:
+                self._index = index
+        self._watermark = watermark
+        return self._index
+
+    def _run_refresher(self):
+        while True:
+            time.sleep(getattr(settings, 'SUGGEST_REFRESH_INTERVAL', 30))
+            try:
+                self.refresh()
+            except Exception:
+                # The current index keeps serving; the next refresh retries.
+                logger.exception("Could not refresh the suggestion index")
+            finally:
+                close_old_connections()
+
+    def get_index(self):
+        if self._index is None:
+            self.rebuild()
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._run_refresher, name='suggest-refresher', daemon=True)
+                    self._refresher.start()
+        return self._index
+
+    def suggest(self, prefix, limit=None):
+        limit = max(1, min(limit or max_limit(), max_limit()))
+        return self.get_index().lookup(prefix, limit)
+
+
+suggester = Suggester()
@@ -1,4 +1,11 @@
 from django import template
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from ecommerce.product_cards import product_cards
+from ecommerce.renditions import renditions_for
 
 register = template.Library()
 
@@ -12,4 +19,44 @@ def to(value):
 
 @register.filter
 def range_filter(value):
-    return range(value)
\ No newline at end of file
+    return range(value)
+
+@register.simple_tag(takes_context=True)
+def responsive_image(context, image, sizes=None, **attrs):
+    """
+    Render ``image`` as a <picture> offering its WebP renditions and a
+    JPEG/PNG srcset, falling back to the original upload when no renditions
+    exist yet. Extra keyword arguments become <img> attributes.
+    """
+    if not image:
+        return ''
+    found = renditions_for(image.name, context.get('request'))
+    if not found:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    storage = image.storage
+    srcsets = {'webp': [], 'fallback': []}
+    for width, fmt, name in found:
+        srcsets['webp' if fmt == 'webp' else 'fallback'].append(f'{storage.url(name)} {width}w')
+    sizes = sizes or getattr(settings, 'IMAGE_RENDITION_SIZES', '100vw')
+    return format_html(
+        '<picture style="display: contents"><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        ', '.join(srcsets['webp']), sizes, image.url, ', '.join(srcsets['fallback']), sizes, flatatt(attrs),
+    )
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_product_cards(context, products, variant='grid'):
+    """Load the cards of a whole listing with one cache round trip before the loop."""
+    cards = context.render_context.setdefault('product_cards', {})
+    cards.setdefault(variant, {}).update(product_cards.get_many(list(products), variant))
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def product_card(context, product, variant='grid'):
+    html = context.render_context.get('product_cards', {}).get(variant, {}).get(product.pk)
+    if html is None:
+        html = product_cards.get(product, variant)
+    return mark_safe(html)
@@ -1,3 +1,900 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import CartLine, Order, OrderItem
+from . import catalog_cache, facets, query_budget, renditions, review_stats, reviews, search
+from PIL import Image
+
+from .imaging import render
+from .models import Brand, Category, Customer, ImageRendition, MediaBlob, Product, Review, Tag, Vendor
+from .storage import collect_garbage
+from .pagination import keyset_page
+from .views import LISTING_ORDERINGS, serve_media
+from .product_cards import ProductCardCache, discount_percentage, product_cards
+from .suggest import SuggestIndex, Suggester
+from .result_cache import ResultCache, canonical_price, canonical_query, make_key, result_cache
+
+
+# Tests run against a local cache, never the developer's .django_cache, and
+# fail on a query budget overrun whichever settings module is in use. Facet
+# columns are rebuilt in the request: a thread can't see the test transaction.
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'QUERY_BUDGET_RAISE': True,
+    'FACET_BACKGROUND_REBUILD': False,
+}
+
+
+def clear_caches():
+    """Start from cold caches, as a freshly started worker would."""
+    cache.clear()
+    catalog_cache.clear()
+    facets.clear()
+    result_cache.clear()
+    product_cards.clear()
+    query_budget.reset()
+
+
+@override_settings(**TEST_SETTINGS)
+class CatalogTestCase(TestCase):
+    """
+    A small catalog, and a customer with a delivered order, a review and
+    three lines in their cart.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor_user = User.objects.create_user('vendor', password='secret')
+        cls.vendor = Vendor.objects.create(user=vendor_user, business_name='Vendor')
+        cls.category = Category.objects.create(name='Cars', image='category_image/cars.jpg')
+        cls.brand = Brand.objects.create(name='BMW', image='brands/bmw.jpg')
+        cls.tag = Tag.objects.create(name='fast')
+        cls.products = []
+        for number in range(30):
+            product = Product.objects.create(
+                name=f'BMW M{number}',
+                description=f'Coupe number {number}',
+                product_image=f'product_image/m{number}.jpg',
+                price=Decimal('100.00') + number,
+                sale_price=Decimal('90.00') if number % 3 == 0 else None,
+                on_sale=number % 3 == 0,
+                stock=10,
+                vendor=cls.vendor,
+                category=cls.category,
+                brand=cls.brand,
+            )
+            product.tag.add(cls.tag)
+            cls.products.append(product)
+        cls.product = cls.products[0]
+
+        cls.user = User.objects.create_user('customer', password='secret')
+        Customer.objects.create(user=cls.user)
+        cls.order = Order.objects.create(
+            user=cls.user, total_amount=Decimal('201.00'), shipping_address='Street 1', shipment_status='Delivered')
+        for product in cls.products[:2]:
+            OrderItem.objects.create(order=cls.order, product=product, quantity=1, price=product.price, total_price=product.price)
+        Review.objects.create(product=cls.products[1], user=cls.user, rating=4, review_text='Quick.')
+        for product in cls.products[2:5]:
+            CartLine.objects.create(
+                user=cls.user, product=product, quantity=2, price_cents=int(product.price * 100),
+                sale_price_cents=int(product.sale_price * 100) if product.sale_price else None,
+                price_version=product.price_version)
+
+    def setUp(self):
+        clear_caches()
+
+
+class QueryBudgetTests(CatalogTestCase):
+    """
+    Render every view in QUERY_BUDGETS from cold caches, anonymously and as
+    a signed-in customer; an overrun raises QueryBudgetExceeded.
+    """
+
+    def budgeted_urls(self):
+        return {
+            'home': reverse('home'),
+            'product_detail': reverse('product_detail', args=[self.product.pk]),
+            'brand_products': reverse('brand_products', args=[self.brand.pk]),
+            'store_detail': reverse('store_detail', args=[self.vendor.pk]),
+            'category_detail': reverse('category_detail', args=[self.category.pk]),
+            'search': reverse('search') + '?query=bmw',
+            'cart:cart_detail': reverse('cart:cart_detail'),
+            'cart:order_detail': reverse('cart:order_detail'),
+            'cart:order_detail_view': reverse('cart:order_detail_view', args=[self.order.pk]),
+        }
+
+    def test_budgets_cover_the_budgeted_views(self):
+        from django.conf import settings
+
+        self.assertEqual(set(self.budgeted_urls()), set(settings.QUERY_BUDGETS))
+
+    def test_anonymous_views_stay_within_budget(self):
+        for name, url in self.budgeted_urls().items():
+            if name.startswith('cart:'):
+                continue
+            with self.subTest(name):
+                clear_caches()
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_customer_views_stay_within_budget(self):
+        self.client.force_login(self.user)
+        for name, url in self.budgeted_urls().items():
+            with self.subTest(name):
+                clear_caches()
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_overrun_raises(self):
+        with self.settings(QUERY_BUDGETS={'home': 0}):
+            with self.assertRaises(query_budget.QueryBudgetExceeded):
+                self.client.get(reverse('home'))
+
+
+class ProductCounterTests(CatalogTestCase):
+    """Counters maintained with F() updates survive full saves of stale instances."""
+
+    def test_full_save_keeps_review_aggregates_and_views(self):
+        product = Product.objects.get(pk=self.products[5].pk)
+        Review.objects.create(product=product, user=self.user, rating=5, review_text='Loud.')
+        Product.objects.filter(pk=product.pk).update(view_count=7)
+
+        product.name = 'BMW M5 Touring'
+        product.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.name, 'BMW M5 Touring')
+        self.assertEqual((product.review_count, product.rating_5, product.rating_average), (1, 1, 5.0))
+        self.assertEqual(product.view_count, 7)
+
+
+
+class FacetStoreTests(CatalogTestCase):
+    """A catalog change is picked up in the background; searches keep the old columns meanwhile."""
+
+    @override_settings(FACET_BACKGROUND_REBUILD=True)
+    def test_previous_columns_serve_while_rebuilding(self):
+        columns = facets.get_store()
+        Product.objects.filter(pk=self.products[0].pk).update(on_sale=False)
+        catalog_cache.bump_version()
+
+        with mock.patch('ecommerce.facets.threading.Thread') as thread:
+            self.assertIs(facets.get_store(), columns)
+            self.assertIs(facets.get_store(), columns)
+        thread.assert_called_once()
+        self.assertEqual(facets.compute([self.products[0].pk])['on_sale'], 1)
+
+        facets._rebuild(*thread.call_args.kwargs['args'])
+        self.assertIsNot(facets.get_store(), columns)
+        self.assertEqual(facets.compute([self.products[0].pk])['on_sale'], 0)
+
+
+class SearchTests(CatalogTestCase):
+    """BM25 ranking over the FTS5 table, kept in step with product saves, and its in-memory fallback."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.zonda = Product.objects.create(
+            name='Pagani Zonda', description='Hand built.', product_image='product_image/zonda.jpg',
+            price=Decimal('900.00'), stock=1, vendor=cls.vendor, category=cls.category)
+        cls.mention = Product.objects.create(
+            name='Tribute', description='Styled after the <b>Zonda</b>.', product_image='product_image/tribute.jpg',
+            price=Decimal('300.00'), stock=1, vendor=cls.vendor, category=cls.category)
+
+    def ranked(self, query):
+        return [product_id for product_id, score in search.search(query)]
+
+    def assert_ranking(self):
+        self.assertEqual(self.ranked('zonda'), [self.zonda.pk, self.mention.pk])
+        self.assertEqual(self.ranked('zon'), [self.zonda.pk, self.mention.pk])
+        self.assertEqual(self.ranked('pagani zonda'), [self.zonda.pk])
+        self.assertEqual(self.ranked('koenigsegg'), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(search.get_backend().name, 'fts5')
+        self.assert_ranking()
+
+    def test_in_memory_fallback_ranks_the_same(self):
+        with self.settings(SEARCH_BACKEND='memory'):
+            search.rebuild()
+            self.assertEqual(search.get_backend().name, 'memory')
+            self.assert_ranking()
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ('zonda OR', '"zonda', 'NEAR(zonda)', 'name:zonda', '*'):
+            with self.subTest(query):
+                self.assertEqual(set(self.ranked(query)) - {self.zonda.pk, self.mention.pk}, set())
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.zonda.name = 'Pagani Huayra'
+        self.zonda.save()
+        self.assertEqual(self.ranked('huayra'), [self.zonda.pk])
+        self.assertEqual(self.ranked('zonda'), [self.mention.pk])
+
+        self.mention.delete()
+        self.assertEqual(self.ranked('zonda'), [])
+
+    def test_search_view_orders_by_relevance(self):
+        response = self.client.get(reverse('search'), {'query': 'zonda'})
+        self.assertEqual([product.pk for product in response.context['products']], [self.zonda.pk, self.mention.pk])
+
+
+class SearchPagingTests(CatalogTestCase):
+    """The XHR mode of search_view, paged with signed cursors."""
+
+    def fetch(self, **params):
+        return self.client.get(reverse('search'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def walk(self, cursor=None, **params):
+        ids = []
+        while True:
+            data = self.fetch(**params, **({'cursor': cursor} if cursor else {})).json()
+            ids += [product['id'] for product in data['products']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_pages_cover_the_results_once(self):
+        for sort_by in ('', 'price_desc', 'view_count'):
+            with self.subTest(sort_by):
+                ids = self.walk(query='bmw', sort_by=sort_by, page_size=7)
+                self.assertEqual(len(ids), 30)
+                self.assertEqual(set(ids), {product.pk for product in self.products})
+
+    def test_price_order_holds_across_pages(self):
+        ids = self.walk(query='bmw', sort_by='price_desc', page_size=4)
+        self.assertEqual(ids, [product.pk for product in reversed(self.products)])
+
+    def test_paging_resumes_after_the_last_row_is_deleted(self):
+        for sort_by in ('', 'price'):
+            with self.subTest(sort_by):
+                first = self.fetch(query='bmw', sort_by=sort_by, page_size=5).json()
+                seen = [product['id'] for product in first['products']]
+                Product.objects.filter(pk=seen[-1]).delete()
+                rest = self.walk(query='bmw', sort_by=sort_by, page_size=5, cursor=first['next_cursor'])
+                self.assertEqual(len(seen) + len(rest), len(set(seen + rest)))
+                self.assertEqual(len(set(seen + rest)), Product.objects.count() + 1)
+
+    def test_tampered_cursors_are_rejected(self):
+        cursor = self.fetch(query='bmw', page_size=5).json()['next_cursor']
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        self.assertEqual(self.fetch(query='bmw', page_size=5, cursor=tampered).status_code, 400)
+        self.assertEqual(self.fetch(query='bmw', page_size=5, cursor='garbage').status_code, 400)
+        # A valid cursor for another ordering is refused too.
+        self.assertEqual(self.fetch(query='bmw', page_size=5, sort_by='price', cursor=cursor).status_code, 400)
+
+    def test_large_pages_are_streamed(self):
+        response = self.fetch(query='bmw', page_size=60)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((len(data['products']), data['total'], data['next_cursor']), (30, 30, None))
+        self.assertEqual(data['facets']['total'], 30)
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_equivalent_parameters_share_a_key(self):
+        self.assertEqual(canonical_query('  BMW   m3 '), 'bmw m3')
+        self.assertEqual(canonical_price(' 10.50'), canonical_price('10.5'))
+        self.assertEqual(make_key('search', query='bmw', min_price='10'), make_key('search', min_price='10', query='bmw'))
+
+    def test_entries_belong_to_a_catalog_version(self):
+        cache = ResultCache()
+        cache.set('key', 1, [3, 1, 2])
+        self.assertEqual(list(cache.get('key', 1)), [3, 1, 2])
+        self.assertIsNone(cache.get('key', 2))
+        self.assertIsNone(cache.get('key', 1))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_entries_expire(self):
+        cache = ResultCache()
+        with self.settings(RESULT_CACHE_TIMEOUT=0):
+            cache.set('key', 1, [1])
+        self.assertIsNone(cache.get('key', 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache()
+        with self.settings(RESULT_CACHE_MAX_BYTES=2500):
+            cache.set('a', 1, range(100))
+            cache.set('b', 1, range(100))
+            cache.get('a', 1)
+            cache.set('c', 1, range(100))
+            self.assertLessEqual(cache.stats()['bytes'], 2500)
+            self.assertIsNone(cache.get('b', 1))
+            self.assertIsNotNone(cache.get('a', 1))
+            # An entry larger than the whole cache is served but not kept.
+            self.assertEqual(len(cache.set('d', 1, range(1000))), 1000)
+            self.assertIsNone(cache.get('d', 1))
+
+
+class SearchResultCacheTests(CatalogTestCase):
+    def test_equivalent_searches_hit_the_cache(self):
+        self.client.get(reverse('search'), {'query': 'BMW', 'min_price': '110.0'})
+        hits = result_cache.hits
+        response = self.client.get(reverse('search'), {'query': '  bmw ', 'min_price': '110'})
+        self.assertEqual(result_cache.hits, hits + 2)
+        self.assertEqual(response.context['total'], 20)
+
+    def test_catalog_changes_are_seen_at_once(self):
+        self.client.get(reverse('search'), {'query': 'bmw', 'min_price': '110'})
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.price = Decimal('500.00')
+        product.save()
+        response = self.client.get(reverse('search'), {'query': 'bmw', 'min_price': '110'})
+        self.assertEqual(response.context['total'], 21)
+
+
+class FacetCountTests(CatalogTestCase):
+    """Facet counts for search results, computed from the column store."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_category = Category.objects.create(name='Bikes', image='category_image/bikes.jpg')
+        cls.bike = Product.objects.create(
+            name='BMW R18', description='Cruiser.', product_image='product_image/r18.jpg', price=Decimal('40.00'),
+            stock=1, vendor=cls.vendor, category=cls.other_category)
+
+    def test_counts_every_facet(self):
+        counts = facets.compute([product.pk for product in self.products] + [self.bike.pk])
+        self.assertEqual(counts['total'], 31)
+        self.assertEqual(counts['categories'], [
+            {'id': self.category.pk, 'name': 'Cars', 'count': 30},
+            {'id': self.other_category.pk, 'name': 'Bikes', 'count': 1},
+        ])
+        self.assertEqual(counts['brands'], [{'id': self.brand.pk, 'name': 'BMW', 'count': 30}])
+        self.assertEqual(counts['tags'], [{'id': self.tag.pk, 'name': 'fast', 'count': 30}])
+        self.assertEqual(counts['on_sale'], 10)
+        self.assertEqual([bucket['count'] for bucket in counts['price']], [1, 0, 30, 0, 0, 0])
+        self.assertEqual(counts['price'][-1], {'min': 1000, 'max': None, 'label': '1000+', 'count': 0})
+
+    def test_unknown_ids_are_skipped(self):
+        self.assertEqual(facets.compute([self.products[0].pk, 10 ** 9])['total'], 1)
+
+    def test_search_facets_follow_the_filters(self):
+        response = self.client.get(reverse('search'), {'query': 'bmw', 'max_price': '110'})
+        counts = response.context['facets']
+        self.assertEqual(counts['total'], 12)
+        self.assertEqual([(item['name'], item['count']) for item in counts['categories']], [('Cars', 11), ('Bikes', 1)])
+        self.assertEqual(counts['on_sale'], 4)
+
+    def test_catalog_changes_reach_the_counts(self):
+        facets.compute([self.bike.pk])
+        self.bike.tag.add(self.tag)
+        self.assertEqual(facets.compute([self.bike.pk])['tags'][0]['count'], 1)
+
+
+class SuggestIndexTests(SimpleTestCase):
+    def index(self, *labels):
+        return SuggestIndex({
+            ('product', number): {'type': 'product', 'id': number, 'label': label, 'weight': weight, 'url': f'/product/{number}/'}
+            for number, (label, weight) in enumerate(labels, 1)
+        })
+
+    def labels(self, index, prefix, limit=10):
+        return [entry['label'] for entry in index.lookup(prefix, limit)]
+
+    def test_prefixes_match_any_word(self):
+        index = self.index(('BMW M4', 5), ('Audi RS4', 3), ('BMW i4', 1))
+        self.assertEqual(self.labels(index, 'bm'), ['BMW M4', 'BMW i4'])
+        self.assertEqual(self.labels(index, 'M4'), ['BMW M4'])
+        self.assertEqual(self.labels(index, 'bmw  i'), ['BMW i4'])
+        self.assertEqual(self.labels(index, 'porsche'), [])
+        self.assertEqual(self.labels(index, '  '), [])
+
+    def test_heavier_entries_come_first_up_to_the_limit(self):
+        index = self.index(('Mini', 1), ('Miata', 9), ('Mirage', 4), ('Minor', 4))
+        self.assertEqual(self.labels(index, 'mi', 3), ['Miata', 'Mirage', 'Minor'])
+        self.assertEqual(self.labels(index, 'min'), ['Minor', 'Mini'])
+
+
+class SuggesterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.suggester = Suggester()
+        self.suggester.rebuild()
+
+    def test_products_weigh_views_and_sales(self):
+        Product.objects.filter(pk=self.products[7].pk).update(view_count=15)
+        self.suggester.rebuild()
+        labels = [entry['label'] for entry in self.suggester.suggest('bmw m', 3)]
+        self.assertEqual(labels, ['BMW M7', 'BMW M0', 'BMW M1'])
+
+    def test_brands_and_categories_are_suggested(self):
+        self.assertEqual(
+            [(entry['type'], entry['url']) for entry in self.suggester.suggest('car')],
+            [('category', reverse('category_detail', args=[self.category.pk]))],
+        )
+        self.assertIn('brand', [entry['type'] for entry in self.suggester.suggest('bmw')])
+
+    def test_refresh_merges_changed_rows(self):
+        product = Product.objects.get(pk=self.products[3].pk)
+        product.name = 'Alpina B3'
+        product.save()
+        self.assertEqual(self.suggester.suggest('alpina'), [])
+        self.suggester.refresh()
+        self.assertEqual([entry['id'] for entry in self.suggester.suggest('alpina')], [product.pk])
+        self.assertNotIn(product.pk, [entry['id'] for entry in self.suggester.suggest('bmw m3')])
+
+    def test_suggest_view_caps_the_limit(self):
+        with mock.patch('ecommerce.views.suggester', self.suggester), \
+                mock.patch('ecommerce.suggest.threading.Thread'):
+            response = self.client.get(reverse('search_suggest'), {'query': 'bmw', 'limit': 1000})
+        self.assertEqual(len(response.json()['suggestions']), 10)
+
+
+class ReviewStatsTests(CatalogTestCase):
+    """Product review aggregates follow reviews being written, edited and deleted."""
+
+    def stats(self, product):
+        product = Product.objects.get(pk=product.pk)
+        return product.review_count, product.review_sum, product.rating_histogram, product.rating_average
+
+    def test_created_reviews_are_counted(self):
+        product = self.products[1]
+        self.assertEqual(self.stats(product), (1, 4, [0, 0, 0, 1, 0], 4.0))
+        Review.objects.create(product=product, user=self.vendor.user, rating=1, review_text='Slow.')
+        self.assertEqual(self.stats(product), (2, 5, [1, 0, 0, 1, 0], 2.5))
+
+    def test_edited_reviews_move_the_histogram(self):
+        review = Review.objects.get(product=self.products[1])
+        review.rating = 2
+        review.save()
+        self.assertEqual(self.stats(self.products[1]), (1, 2, [0, 1, 0, 0, 0], 2.0))
+
+        review.product = self.products[6]
+        review.save()
+        self.assertEqual(self.stats(self.products[1]), (0, 0, [0, 0, 0, 0, 0], 0.0))
+        self.assertEqual(self.stats(self.products[6]), (1, 2, [0, 1, 0, 0, 0], 2.0))
+
+    def test_unloaded_saves_recompute(self):
+        review = Review.objects.get(product=self.products[1])
+        Review(pk=review.pk, product=review.product, user=self.user, rating=5, review_text='Edited.',
+               created_at=review.created_at).save()
+        self.assertEqual(self.stats(self.products[1]), (1, 5, [0, 0, 0, 0, 1], 5.0))
+
+    def test_deleted_reviews_are_subtracted(self):
+        Review.objects.get(product=self.products[1]).delete()
+        self.assertEqual(self.stats(self.products[1]), (0, 0, [0, 0, 0, 0, 0], 0.0))
+
+    def test_recompute_repairs_drift(self):
+        Product.objects.filter(pk=self.products[1].pk).update(review_count=9, rating_4=0)
+        self.assertEqual(review_stats.recompute(), 1)
+        self.assertEqual(self.stats(self.products[1]), (1, 4, [0, 0, 0, 1, 0], 4.0))
+        self.assertEqual(review_stats.recompute(), 0)
+
+
+class ReviewStreamTests(CatalogTestCase):
+    """The product page's review stream, paged by keyset cursors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reviewed = cls.products[8]
+        cls.reviews = [
+            Review.objects.create(product=cls.reviewed, user=cls.user, rating=1 + number % 5, review_text=f'Take {number}.')
+            for number in range(12)
+        ]
+
+    def fetch(self, **params):
+        return self.client.get(reverse('product_reviews', args=[self.reviewed.pk]), params)
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            data = self.fetch(**params, **({'cursor': cursor} if cursor else {})).json()
+            ids += [review['id'] for review in data['reviews']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_pages_walk_every_review_in_order(self):
+        self.assertEqual(self.walk(page_size=5), [review.pk for review in reversed(self.reviews)])
+        by_rating = sorted(reversed(self.reviews), key=lambda review: -review.rating)
+        self.assertEqual(self.walk(page_size=5, order_by='rating'), [review.pk for review in by_rating])
+
+    def test_a_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            page, next_cursor = reviews.review_page(self.reviewed.pk, 'helpful', size=5)
+            [review.user.username for review in page]
+        self.assertIsNotNone(next_cursor)
+
+    def test_bad_parameters_are_rejected(self):
+        self.assertEqual(self.fetch(order_by='loudest').status_code, 400)
+        self.assertEqual(self.fetch(cursor='garbage').status_code, 400)
+        cursor = self.fetch(page_size=5).json()['next_cursor']
+        self.assertEqual(self.fetch(order_by='rating', cursor=cursor).status_code, 400)
+
+    def test_helpful_votes_count_once_per_user(self):
+        review = self.reviews[0]
+        self.client.force_login(self.vendor.user)
+        url = reverse('review_helpful', args=[review.pk])
+        self.assertEqual(self.client.post(url).json()['helpful_count'], 1)
+        self.assertFalse(self.client.post(url).json()['success'])
+        self.assertEqual(self.walk(order_by='helpful', page_size=5)[0], review.pk)
+
+    def test_cached_first_page_is_dropped_on_new_reviews(self):
+        before = reviews.first_page(self.reviewed.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.reviewed, user=self.user, rating=5, review_text='Newest take.')
+        after = reviews.first_page(self.reviewed.pk)
+        self.assertNotIn('Newest take.', before['html'])
+        self.assertIn('Newest take.', after['html'])
+
+
+class PageCacheTests(CatalogTestCase):
+    """Anonymous catalog pages are cached whole and revalidated with their ETag."""
+
+    def test_revalidation_answers_304(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_cached_pages_are_served_compressed(self):
+        plain = self.client.get(reverse('home'))
+        compressed = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+    def test_signed_in_customers_bypass_the_cache(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_new_review_invalidates_the_product_page(self):
+        url = reverse('product_detail', args=[self.products[6].pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.products[6], user=self.user, rating=5, review_text='Sublime.')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sublime.')
+
+    def test_stock_change_invalidates_only_the_product_page(self):
+        product_url = reverse('product_detail', args=[self.products[6].pk])
+        product_etag = self.client.get(product_url)['ETag']
+        category_etag = self.client.get(reverse('category_detail', args=[self.category.pk]))['ETag']
+
+        product = Product.objects.get(pk=self.products[6].pk)
+        product.stock = 3
+        product.save(update_fields=['stock', 'availability', 'updated_at'])
+
+        response = self.client.get(product_url, HTTP_IF_NONE_MATCH=product_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '3 available')
+        listing = self.client.get(reverse('category_detail', args=[self.category.pk]), HTTP_IF_NONE_MATCH=category_etag)
+        self.assertEqual(listing.status_code, 304)
+
+
+def image_bytes(size=(400, 300), mode='RGB', fmt='JPEG', color=(200, 30, 30)):
+    out = io.BytesIO()
+    Image.new(mode, size, color).save(out, fmt)
+    return out.getvalue()
+
+
+class TemporaryMediaMixin:
+    """Store uploads under a throw-away MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = self.settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ImagingTests(SimpleTestCase):
+    def test_renders_webp_and_jpeg_without_upscaling(self):
+        results = render(image_bytes(), [160, 320, 640])
+        self.assertEqual([(width, height, fmt) for width, height, fmt, _ in results], [
+            (160, 120, 'webp'), (160, 120, 'jpeg'),
+            (320, 240, 'webp'), (320, 240, 'jpeg'),
+            (400, 300, 'webp'), (400, 300, 'jpeg'),
+        ])
+        with Image.open(io.BytesIO(results[0][3])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 120)))
+
+    def test_transparent_images_fall_back_to_png(self):
+        results = render(image_bytes(mode='RGBA', fmt='PNG', color=(0, 0, 0, 0)), [160])
+        self.assertEqual([fmt for _, _, fmt, _ in results], ['webp', 'png'])
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=[160, 320])
+class RenditionTests(TemporaryMediaMixin, CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch('ecommerce.renditions.process_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = default_storage.save('product_image/red.jpg', ContentFile(image_bytes()))
+
+    def generate(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return renditions.generate(default_storage, self.source, **kwargs)
+
+    def test_generate_stores_every_size_once(self):
+        self.assertEqual(self.generate(), 4)
+        self.assertEqual(self.generate(), 0)
+        found = renditions.renditions_for(self.source)
+        self.assertEqual(sorted((width, fmt) for width, fmt, _ in found), [(160, 'jpeg'), (160, 'webp'), (320, 'jpeg'), (320, 'webp')])
+        for _, _, name in found:
+            self.assertTrue(default_storage.exists(name))
+
+    def test_forced_regeneration_keeps_the_stored_files(self):
+        self.generate()
+        names = set(ImageRendition.objects.values_list('name', flat=True))
+        self.assertEqual(self.generate(force=True), 4)
+        self.assertEqual(set(ImageRendition.objects.values_list('name', flat=True)), names)
+
+    def test_responsive_image_offers_the_renditions(self):
+        template = Template('{% load custom_tags %}{% responsive_image image sizes="50vw" alt="Red" %}')
+        Product.objects.filter(pk=self.product.pk).update(product_image=self.source)
+        image = Product.objects.get(pk=self.product.pk).product_image
+
+        self.assertEqual(template.render(Context({'image': image})), f'<img src="{image.url}" alt="Red">')
+        self.generate()
+        html = template.render(Context({'image': image}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(' 320w', html)
+        self.assertIn('sizes="50vw"', html)
+
+    def test_prune_drops_renditions_of_unreferenced_images(self):
+        self.generate()
+        self.assertEqual(renditions.prune(), 4)
+        self.assertFalse(ImageRendition.objects.exists())
+
+
+class ContentAddressedStorageTests(TemporaryMediaMixin, CatalogTestCase):
+    """Uploads are stored once per distinct content and reference counted."""
+
+    def test_identical_uploads_share_one_blob(self):
+        data = image_bytes()
+        first = default_storage.save('product_image/a.JPG', ContentFile(data))
+        second = default_storage.save('brands/b.jpg', ContentFile(data))
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual(MediaBlob.objects.get(digest=digest).ref_count, 2)
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(first))), [os.path.basename(first)])
+
+        other = default_storage.save('product_image/a.jpg', ContentFile(image_bytes(color=(0, 0, 255))))
+        self.assertNotEqual(other, first)
+
+    def test_deleting_drops_a_reference_but_keeps_the_file(self):
+        name = default_storage.save('product_image/a.jpg', ContentFile(image_bytes()))
+        default_storage.save('product_image/b.jpg', ContentFile(image_bytes()))
+        default_storage.delete(name)
+        default_storage.delete(name)
+        default_storage.delete(name)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_garbage_collection_removes_unreferenced_blobs(self):
+        kept = default_storage.save('product_image/kept.jpg', ContentFile(image_bytes()))
+        unused = default_storage.save('product_image/unused.jpg', ContentFile(image_bytes(color=(0, 255, 0))))
+        Product.objects.filter(pk__in=[product.pk for product in self.products[:3]]).update(product_image=kept)
+
+        self.assertEqual(collect_garbage()[0], 0, "blobs within the grace period are kept")
+        removed, freed = collect_garbage(grace_period=0, dry_run=True)
+        self.assertEqual((removed, freed), (1, MediaBlob.objects.get(name=unused).size))
+        self.assertTrue(default_storage.exists(unused))
+
+        self.assertEqual(collect_garbage(grace_period=0), (removed, freed))
+        self.assertFalse(default_storage.exists(unused))
+        self.assertFalse(MediaBlob.objects.filter(name=unused).exists())
+        self.assertTrue(default_storage.exists(kept))
+        self.assertEqual(MediaBlob.objects.get(name=kept).ref_count, 3)
+
+    def test_garbage_collection_removes_stray_files(self):
+        name = default_storage.save('product_image/stray.jpg', ContentFile(image_bytes()))
+        MediaBlob.objects.filter(name=name).delete()
+        self.assertEqual(collect_garbage(grace_period=0)[0], 1)
+        self.assertFalse(default_storage.exists(name))
+
+
+class ServeMediaTests(TemporaryMediaMixin, SimpleTestCase):
+    """serve_media: conditional GET, byte ranges and confinement to MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(100))
+        self.path = 'docs/manual.pdf'
+        self.write(self.path, self.data)
+
+    def write(self, name, data):
+        os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+        with open(default_storage.path(name), 'wb') as out:
+            out.write(data)
+
+    def get(self, path=None, **headers):
+        response = self.client.get(reverse('media', args=[path or self.path]), headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+        revalidated, _ = self.get(If_None_Match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_byte_ranges(self):
+        for header, expected, content_range in (
+            ('bytes=0-3', self.data[:4], 'bytes 0-3/100'),
+            ('bytes=96-', self.data[96:], 'bytes 96-99/100'),
+            ('bytes=-5', self.data[95:], 'bytes 95-99/100'),
+            ('bytes=90-500', self.data[90:], 'bytes 90-99/100'),
+        ):
+            with self.subTest(header):
+                response, body = self.get(Range=header)
+                self.assertEqual((response.status_code, body), (206, expected))
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(int(response['Content-Length']), len(expected))
+
+    def test_unsatisfiable_ranges_answer_416(self):
+        for header in ('bytes=100-', 'bytes=50-10', 'bytes=-0'):
+            with self.subTest(header):
+                response, _ = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_unsupported_ranges_get_the_whole_file(self):
+        response, body = self.get(Range='bytes=0-1,5-6')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_if_range_serves_the_range_only_while_unchanged(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(Range='bytes=0-1', If_Range=etag)
+        self.assertEqual((response.status_code, body), (206, self.data[:2]))
+        response, body = self.get(Range='bytes=0-1', If_Range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_paths_outside_media_root_are_not_served(self):
+        request = RequestFactory().get('/media/')
+        for path in ('../ECOM/settings.py', '/etc/passwd', 'docs/../../outside', 'docs', 'docs/missing.pdf'):
+            with self.subTest(path):
+                with self.assertRaises(Http404):
+                    serve_media(request, path)
+
+    def test_content_hashed_names_are_immutable(self):
+        name = default_storage.blob_name(hashlib.sha256(self.data).hexdigest(), '.pdf')
+        self.write(name, self.data)
+        self.assertEqual(self.get(name)[0]['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_front_proxy_sends_the_file(self):
+        response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/docs/manual.pdf')
+        self.assertEqual(body, b'')
+
+
+class ProductCardTests(CatalogTestCase):
+    """Rendered cards are shared through the cache and keyed on updated_at."""
+
+    def setUp(self):
+        super().setUp()
+        self.cards = ProductCardCache()
+        self.listing = list(Product.objects.filter(pk__in=[product.pk for product in self.products[:4]]))
+
+    def test_cards_render_once(self):
+        with mock.patch.object(ProductCardCache, 'render', autospec=True, return_value='<div>card</div>') as render:
+            self.cards.get_many(self.listing)
+            self.cards.get_many(self.listing)
+            # Another worker starts with an empty local cache but shares the rendered cards.
+            ProductCardCache().get_many(self.listing)
+        self.assertEqual(render.call_count, 4)
+
+    def test_saved_products_get_a_fresh_card(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertIn('BMW M0', self.cards.get(product))
+        product.name = 'BMW M0 CSL'
+        product.save()
+        self.assertIn('BMW M0 CSL', self.cards.get(Product.objects.get(pk=product.pk)))
+
+    def test_variants_are_cached_apart(self):
+        with mock.patch.object(ProductCardCache, 'render', autospec=True, side_effect=lambda cache, product, variant: variant):
+            self.assertEqual(self.cards.get(self.product, 'sale'), 'sale')
+            self.assertEqual(self.cards.get(self.product, 'grid'), 'grid')
+
+    @override_settings(PRODUCT_CARD_CACHE_SIZE=3)
+    def test_local_cache_is_bounded(self):
+        self.cards.get_many(self.listing)
+        self.assertEqual(len(self.cards._entries), 3)
+
+    def test_discount_percentage(self):
+        self.assertEqual(discount_percentage(self.products[3]), Decimal('12.62'))
+        self.assertIsNone(discount_percentage(self.products[1]))
+
+    def test_listing_renders_every_card(self):
+        response = self.client.get(reverse('category_detail', args=[self.category.pk]))
+        for product in response.context['category_products']:
+            self.assertContains(response, f'href="{reverse("product_detail", args=[product.pk])}"')
+        self.assertTrue(response.context['category_products'])
+
+
+class KeysetListingTests(CatalogTestCase):
+    """Brand, store and category listings paged by keyset cursors."""
+
+    def listing_urls(self):
+        return {
+            'brand': reverse('brand_products', args=[self.brand.pk]),
+            'store': reverse('store_detail', args=[self.vendor.pk]),
+            'category': reverse('category_detail', args=[self.category.pk]),
+        }
+
+    def walk(self, url, cursor=None, **params):
+        ids = []
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})},
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            data = response.json()
+            ids += [product['id'] for product in data['products']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids, data['total']
+
+    def test_every_sort_walks_the_listing_once(self):
+        for name, url in self.listing_urls().items():
+            for sort, ordering in LISTING_ORDERINGS.items():
+                with self.subTest(name, sort=sort):
+                    ids, total = self.walk(url, sort=sort, page_size=7)
+                    expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+                    self.assertEqual((ids, total), (expected, 30))
+
+    def test_rows_added_mid_walk_are_not_repeated(self):
+        url = self.listing_urls()['brand']
+        first = self.client.get(url, {'page_size': 10}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        Product.objects.create(
+            name='BMW M31', description='Late.', product_image='product_image/m31.jpg', price=Decimal('131.00'),
+            stock=1, vendor=self.vendor, category=self.category, brand=self.brand)
+        rest, _ = self.walk(url, page_size=10, cursor=first['next_cursor'])
+        seen = [product['id'] for product in first['products']] + rest
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 30)
+
+    def test_bad_cursors(self):
+        for url in self.listing_urls().values():
+            with self.subTest(url):
+                response = self.client.get(url, {'cursor': 'garbage'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                self.assertEqual(response.status_code, 400)
+                self.assertRedirects(self.client.get(url, {'cursor': 'garbage'}), url, fetch_redirect_response=False)
+
+    def test_first_page_is_rendered_with_its_cursor(self):
+        response = self.client.get(self.listing_urls()['store'], {'sort': 'price', 'page_size': 5})
+        self.assertEqual([product.pk for product in response.context['products']], [product.pk for product in self.products[:5]])
+        self.assertIsNotNone(response.context['listing'].next_cursor)
+        self.assertEqual(response.context['listing_sort'], 'price')
+
+    def test_a_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            page = keyset_page(Product.objects.filter(brand=self.brand), LISTING_ORDERINGS['popular'], None, 5)
+        with self.assertNumQueries(1):
+            keyset_page(Product.objects.filter(brand=self.brand), LISTING_ORDERINGS['popular'], page.next_cursor, 5)
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from .views import HomeView, ProductCarouselView, ProductDetailView, CategoryListView,CategoryDetailView, BrandView, StoreView, UserProfileView
-from .views import signup_view, CustomLoginView, custom_logout_view, add_review, search_view, edit_profile
+from .views import signup_view, CustomLoginView, custom_logout_view, add_review, product_reviews, review_helpful, search_view, search_suggest, edit_profile, catalog_cache_stats, query_budget_stats
 from django.urls import path, include
 
 urlpatterns = [
@@ -16,9 +16,14 @@ urlpatterns = [
     path('categories/', CategoryListView.as_view(), name='category_list'),
     path('categories/<int:pk>/', CategoryDetailView.as_view(), name='category_detail'), 
     path('add-review/', add_review, name='add_review'),  
+    path('product/<int:pk>/reviews/', product_reviews, name='product_reviews'),
+    path('reviews/<int:pk>/helpful/', review_helpful, name='review_helpful'),
     path('search/', search_view, name='search'),
+    path('search/suggest/', search_suggest, name='search_suggest'),
     path('user/profile/', UserProfileView, name='user-profile'),
     path('edit-profile/', edit_profile, name='edit_profile'),
+    path('catalog-cache/stats/', catalog_cache_stats, name='catalog_cache_stats'),
+    path('query-budget/stats/', query_budget_stats, name='query_budget_stats'),
 
 
     path('password_reset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
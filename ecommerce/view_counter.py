@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import F
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+def flush_interval():
+    return getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+
+
+def max_pending():
+    return getattr(settings, 'VIEW_COUNTER_MAX_PENDING', 500)
+
+
+def spool_dir():
+    return getattr(settings, 'VIEW_COUNTER_SPOOL_DIR', None)
+
+
+def current_database():
+    return str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+
+
+def apply_counts(counts):
+    # One UPDATE ... SET view_count = view_count + n per distinct n, so a batch
+    # of a few hundred products usually costs a handful of statements.
+    by_increment = defaultdict(list)
+    for product_id, increment in counts.items():
+        if increment > 0:
+            by_increment[increment].append(product_id)
+
+    with transaction.atomic():
+        for increment, product_ids in by_increment.items():
+            Product.objects.filter(id__in=product_ids).update(view_count=F('view_count') + increment)
+    return sum(counts.values())
+
+
+class ViewCounter:
+    """
+    Buffers product page views and writes them back in batches.
+
+    Views accumulate in memory and are flushed every VIEW_COUNTER_FLUSH_INTERVAL
+    seconds or as soon as VIEW_COUNTER_MAX_PENDING views are pending, which
+    bounds what a crashed worker can lose. When VIEW_COUNTER_SPOOL_DIR is set,
+    views are appended to a per-process spool file instead and applied by the
+    flush_view_counts management command.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._pending_total = 0
+        # The database the pending views were counted against.
+        self._database = None
+        self._last_flush = time.monotonic()
+        self._flusher = None
+
+    def record(self, product_id):
+        directory = spool_dir()
+        if directory:
+            try:
+                self._append_to_spool(directory, product_id)
+            except OSError:
+                logger.exception("Could not spool a product view")
+            return
+
+        with self._lock:
+            if not self._pending:
+                self._database = current_database()
+            self._pending[product_id] += 1
+            self._pending_total += 1
+            due = (self._pending_total >= max_pending()
+                   or time.monotonic() - self._last_flush >= flush_interval())
+        self._ensure_flusher()
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                # Counting a view must never fail the page; flush() kept the
+                # views buffered and the flusher retries them.
+                logger.exception("Could not flush buffered product views")
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        with self._lock:
+            counts, self._pending = self._pending, Counter()
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+            database = self._database
+        if not counts:
+            return 0
+        if database != current_database():
+            # Counted against another database, such as a test database that
+            # is gone by the time the process exits; they belong nowhere else.
+            logger.info("Dropped %d product views counted against %s", sum(counts.values()), database)
+            return 0
+        try:
+            return apply_counts(counts)
+        except Exception:
+            # Put the views back so the next flush retries them.
+            with self._lock:
+                self._pending.update(counts)
+                self._pending_total += sum(counts.values())
+                self._database = database
+            raise
+
+    def _append_to_spool(self, directory, product_id):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'views-{os.getpid()}.log')
+        with open(path, 'a') as spool:
+            spool.write(f'{product_id}\n')
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='view-counter-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(flush_interval())
+            try:
+                self.flush()
+            except Exception:
+                # The views stay buffered and are retried on the next flush.
+                logger.exception("Could not flush buffered product views")
+            finally:
+                close_old_connections()
+
+
+def drain_spool(directory):
+    """Apply and remove every spool file in ``directory``; returns views applied."""
+    if not os.path.isdir(directory):
+        return 0
+    # Files left behind by an interrupted drain are picked up first.
+    claimed = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.flushing')]
+    for name in os.listdir(directory):
+        if not name.endswith('.log'):
+            continue
+        # Renaming claims the file: the owning worker opens a fresh one on its
+        # next view, so nothing written after this point is read twice.
+        path = os.path.join(directory, name)
+        claimed_path = f'{path}.{time.time_ns()}.flushing'
+        try:
+            os.replace(path, claimed_path)
+        except FileNotFoundError:
+            continue
+        claimed.append(claimed_path)
+
+    counts = Counter()
+    for path in claimed:
+        with open(path) as spool:
+            for line in spool:
+                line = line.strip()
+                if line.isdigit():
+                    counts[int(line)] += 1
+
+    applied = apply_counts(counts) if counts else 0
+    for path in claimed:
+        os.remove(path)
+    return applied
+
+
+def _flush_at_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        logger.exception("Could not flush buffered product views at exit; they are lost")
+
+
+view_counter = ViewCounter()
+atexit.register(_flush_at_exit)
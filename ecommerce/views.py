@@ -14,14 +14,57 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.db.models import Avg
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.db.models.functions import Coalesce
+import json
 from django.core.exceptions import ValidationError
 from django.db.models import Q, Case, When, IntegerField, Count, Sum
 from cart.models import Order, OrderItem
 from django.utils import timezone
 from django.contrib.auth.models import AnonymousUser
 from django.views.generic import TemplateView
-
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.decorators import method_decorator
+from django.db.models import Max
+from . import catalog_cache, facets, query_budget, review_eligibility, reviews, search
+from .suggest import suggester
+from .recommendations import recommended_products
+from .related import related_products
+from .view_counter import view_counter
+from .pagination import InvalidCursor, estimated_count, ids_page, keyset_page, page_size_from
+from .result_cache import result_cache, make_key, canonical_price, canonical_query
+from .page_cache import anonymous_page_cache
+from . import media
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.template.loader import render_to_string
+
+
+def latest_update(model, pk=None, **product_filter):
+    """Newest updated_at of ``model`` row ``pk`` and of the products matching ``product_filter``."""
+    stamps = [Product.objects.filter(**product_filter).aggregate(latest=Max('updated_at'))['latest']]
+    if pk is not None:
+        stamps.append(model.objects.filter(pk=pk).values_list('updated_at', flat=True).first())
+    return max(filter(None, stamps), default=None)
+
+
+def product_last_modified(request, pk):
+    return max(filter(None, [
+        Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first(),
+        Review.objects.filter(product_id=pk).aggregate(latest=Max('created_at'))['latest'],
+    ]), default=None)
+
+
+@method_decorator(anonymous_page_cache(lambda request: latest_update(Product)), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'home.html'
 
@@ -29,46 +72,114 @@ class HomeView(TemplateView):
         context = super().get_context_data(**kwargs)
 
         if self.request.user.is_authenticated:
-            customer_user = Customer.objects.filter(user=self.request.user).first()
-            if customer_user:
-                order_items = OrderItem.objects.filter(order__user=self.request.user).values_list('product__category', flat=True).distinct()
-                if order_items.exists():
-                    context['recommended_products'] = Product.objects.filter(category__in=order_items).distinct()
-                else:
-                    context['recommended_products'] = Product.objects.none()
-            else:
-                context['recommended_products'] = Product.objects.none()
+            context['recommended_products'] = recommended_products(self.request.user)
         else:
-            context['recommended_products'] = Product.objects.none()
+            context['recommended_products'] = []
 
-        context['offers'] = Offer.objects.filter(
-            is_active=True,
-            start_date__lte=timezone.now(),
-            end_date__gte=timezone.now()
-        )
+        # Offers, categories, vendors and the sale/latest/trending lists come
+        # from the catalog snapshot in global_context.
+        return context
 
-        sale_products = Product.objects.filter(on_sale=True)
-        for product in sale_products:
-            if product.sale_price and product.price:  
-                discount_percentage = ((product.price - product.sale_price) / product.price) * 100
-                product.discount_percentage = round(discount_percentage, 2)
 
-        context['sale_products'] = sale_products
-        context['categories'] = Category.objects.all()
-        context['vendors'] = Vendor.objects.all()
-        context['latest_products'] = Product.objects.order_by('-created_at')[:6]
-        context['trending_products'] = Product.objects.filter(on_sale=True).order_by('-view_count')[:6]
 
-        return context
+# Listing sort keys, each backed by an index on Product. Every ordering ends
+# in id so it is total, which keeps cursors stable.
+LISTING_ORDERINGS = {
+    'newest': ['-created_at', '-id'],
+    'price': ['price', 'id'],
+    'price_desc': ['-price', '-id'],
+    'popular': ['-view_count', 'id'],
+}
+LISTING_PAGE_PARAMS = ('sort', 'cursor', 'page_size')
+
+
+def listing_ordering(request):
+    sort = request.GET.get('sort')
+    return LISTING_ORDERINGS.get(sort, LISTING_ORDERINGS['newest'])
+
+
+def listing_page_size(request):
+    return page_size_from(
+        request,
+        getattr(settings, 'LISTING_PAGE_SIZE', 24),
+        getattr(settings, 'LISTING_MAX_PAGE_SIZE', 100),
+    )
+
 
+def listing_json(request, page):
+    storage = Product._meta.get_field('product_image').storage
+    return JsonResponse({
+        'products': [{
+            'id': product.id,
+            'name': product.name,
+            'product_image': storage.url(product.product_image.name) if product.product_image else None,
+            'price': product.price,
+        } for product in page.items],
+        'html': render_to_string('costumer/product_grid_items.html', {'products': page.items}, request),
+        'next_cursor': page.next_cursor,
+        'total': page.total,
+    })
+
+
+class KeysetListingMixin:
+    """
+    Serve a product listing one keyset page at a time.
+
+    The page follows ``?cursor=`` in the order chosen by ``?sort=``, and the
+    total shown beside it is a cached estimate rather than a COUNT(*) per
+    request. Infinite-scroll fetches (X-Requested-With) get the next page
+    as JSON with the rendered cards.
+    """
+    listing_context_name = 'products'
+
+    def get_listing_queryset(self):
+        raise NotImplementedError
+
+    def get_listing_page(self):
+        if not hasattr(self, '_listing_page'):
+            queryset = self.get_listing_queryset()
+            page = keyset_page(queryset, listing_ordering(self.request), self.request.GET.get('cursor'), listing_page_size(self.request))
+            page.total = estimated_count(self.request.path, queryset)
+            self._listing_page = page
+        return self._listing_page
+
+    def get(self, request, *args, **kwargs):
+        try:
+            page = self.get_listing_page()
+        except InvalidCursor as e:
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'error': str(e)}, status=400)
+            return redirect(request.path)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return listing_json(request, page)
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = self.get_listing_page()
+        context[self.listing_context_name] = page.items
+        context['listing'] = page
+        context['listing_sort'] = self.request.GET.get('sort') if self.request.GET.get('sort') in LISTING_ORDERINGS else 'newest'
+        context['listing_orderings'] = LISTING_ORDERINGS
+        return context
 
 
-class ProductCarouselView(ListView):
+class ProductCarouselView(KeysetListingMixin, ListView):
     model = Product
     template_name = 'costumer/home/mid-section/product_carousel.html' 
     context_object_name = 'products'  
-    queryset = Product.objects.order_by('-created_at')  
+    listing_context_name = 'sale_products'
+
+    def get_queryset(self):
+        return Product.objects.none()
+
+    def get_listing_queryset(self):
+        return Product.objects.filter(on_sale=True)
 
+@method_decorator(anonymous_page_cache(
+    product_last_modified,
+    on_hit=lambda request, pk: view_counter.record(pk),
+), name='dispatch')
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'costumer/detail/product_detail.html'
@@ -78,43 +189,22 @@ class ProductDetailView(DetailView):
         response = super().get(request, *args, **kwargs)
 
         product = self.object
-        product.view_count += 1  
-        product.save()
+        view_counter.record(product.id)
 
         discount_percentage = 0
         if product.on_sale and product.price and product.sale_price and product.price > 0:
             discount_percentage = round(((product.price - product.sale_price) / product.price) * 100, 1)
 
-        average_rating = product.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-        reviews = product.reviews.all()
-
-        can_review = False
-        if request.user.is_authenticated and Customer.objects.filter(pk=request.user.id).exists():
-            order_items = OrderItem.objects.filter(
-                order__user=request.user,
-                product=product,
-                order__shipment_status='Delivered'
-            )
-            
-            has_reviewed = Review.objects.filter(
-                user=request.user,
-                product=product
-            ).exists()
-    
-            if order_items.exists() and not has_reviewed:
-                can_review = True
-
         context = self.get_context_data(object=product)
         context['discount_percentage'] = discount_percentage
-        context['average_rating'] = round(average_rating, 1)
-        context['reviews'] = reviews
+        context['average_rating'] = round(product.rating_average, 1)
+        context['review_page'] = reviews.first_page(product.id)
+        context['review_orderings'] = reviews.REVIEW_ORDERINGS
         context['tags'] = product.tag.all()
 
-        context['related_products'] = Product.objects.filter(
-            Q(category=product.category) | Q(brand=product.brand)
-        ).exclude(id=product.id)[:4]
+        context['related_products'] = related_products(product)
 
-        context['can_review'] = can_review
+        context['can_review'] = review_eligibility.can_review(request, product.id)
 
         return self.render_to_response(context)
 
@@ -128,12 +218,20 @@ class CategoryListView(ListView):
         return context
 
 
-class BrandView(ListView):
+@method_decorator(anonymous_page_cache(
+    lambda request, pk: latest_update(Brand, pk, brand_id=pk),
+    query_params=LISTING_PAGE_PARAMS,
+), name='dispatch')
+class BrandView(KeysetListingMixin, ListView):
     model = Product
     template_name = 'costumer/detail/brand_list.html'
     context_object_name = 'products'
 
     def get_queryset(self):
+        # The listing itself comes from get_listing_page().
+        return Product.objects.none()
+
+    def get_listing_queryset(self):
         brand_id = self.kwargs['pk']  
         return Product.objects.filter(brand__id=brand_id)  
 
@@ -146,48 +244,68 @@ class BrandView(ListView):
         context['brand_description'] = brand.description
         return context
 
-class StoreView(DetailView):
+@method_decorator(anonymous_page_cache(
+    lambda request, pk: latest_update(Vendor, pk, vendor_id=pk),
+    query_params=LISTING_PAGE_PARAMS,
+), name='dispatch')
+class StoreView(KeysetListingMixin, DetailView):
     model = Vendor
     template_name = 'costumer/detail/store.html'
     context_object_name = 'vendor'
 
+    def get_listing_queryset(self):
+        return Product.objects.filter(vendor_id=self.kwargs['pk'])
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        vendor = self.get_object()
+        vendor = self.object
 
         context['business_name'] = vendor.business_name
         context['profile_picture'] = vendor.profile_picture
         context['address'] = vendor.address
         context['phone_number'] = vendor.phone_number
 
-        context['products'] = Product.objects.filter(vendor=vendor)
-
         return context
 
 
 
-class CategoryDetailView(DetailView):
+@method_decorator(anonymous_page_cache(
+    lambda request, pk: latest_update(Category, pk, category_id=pk),
+    query_params=('query',) + LISTING_PAGE_PARAMS,
+), name='dispatch')
+class CategoryDetailView(KeysetListingMixin, DetailView):
     model = Category
     template_name = 'costumer/detail/category_detail.html'
     context_object_name = 'category'
+    listing_context_name = 'category_products'
+
+    def get_listing_page(self):
+        # Category listings can be filtered by a search query, so the ordered
+        # ids come from the result cache, which also gives an exact total.
+        if not hasattr(self, '_listing_page'):
+            search_query = canonical_query(self.request.GET.get('query', ''))
+            ordering = listing_ordering(self.request)
+            products = Product.objects.filter(category_id=self.kwargs['pk'])
+            if search_query:
+                products = products.filter(
+                    Q(name__icontains=search_query) |
+                    Q(description__icontains=search_query) |
+                    Q(brand__name__icontains=search_query)  
+                )
+            ids = result_cache.get_or_set(
+                make_key('category', category=self.kwargs['pk'], query=search_query, ordering=tuple(ordering)),
+                lambda: products.order_by(*ordering).values_list('id', flat=True),
+            )
+            self._listing_page = ids_page(ids, products, ordering, self.request.GET.get('cursor'), listing_page_size(self.request))
+        return self._listing_page
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = self.get_object()
         
         categories = Category.objects.all()
         context['categories'] = categories
 
-        context['category_products'] = Product.objects.filter(category=category)
-
-        search_query = self.request.GET.get('query', '')
-        if search_query:
-            context['category_products'] = context['category_products'].filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(brand__name__icontains=search_query)  
-            )
         return context
 
 
@@ -253,68 +371,166 @@ def add_review(request):
 
 
 
+def product_reviews(request, pk):
+    order_by = request.GET.get('order_by', reviews.DEFAULT_ORDERING)
+    if order_by not in reviews.REVIEW_ORDERINGS:
+        return JsonResponse({'error': 'Unknown ordering.'}, status=400)
+    size = page_size_from(request, reviews.page_size(), reviews.max_page_size())
+    try:
+        page, next_cursor = reviews.review_page(pk, order_by, request.GET.get('cursor'), size)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'reviews': [reviews.serialize(review) for review in page], 'next_cursor': next_cursor})
+
+
+@login_required
+def review_helpful(request, pk):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+    review = get_object_or_404(Review.objects.only('id', 'product_id'), pk=pk)
+    counted = reviews.mark_helpful(review, request.user)
+    return JsonResponse({
+        'success': counted,
+        'message': 'Thanks for your feedback!' if counted else 'You already marked this review as helpful.',
+        'helpful_count': Review.objects.filter(pk=pk).values_list('helpful_count', flat=True).first(),
+    })
+
+
+SEARCH_ORDERINGS = {
+    'price': ['price', 'id'],
+    'price_desc': ['-price', 'id'],
+    'view_count': ['-view_count', 'id'],
+    'orders': ['-order_count', 'id'],
+    'on_sale': ['price', 'id'],
+    'match_score': ['-match_score', 'id'],
+    'rating': ['-rating_average', 'id'],
+}
+
+
+def search_page_size(request):
+    return page_size_from(
+        request,
+        getattr(settings, 'SEARCH_PAGE_SIZE', 24),
+        getattr(settings, 'SEARCH_MAX_PAGE_SIZE', 100),
+    )
+
+
+# Columns an XHR search page serializes, plus the ones its cursors sort on.
+SEARCH_JSON_FIELDS = ('id', 'name', 'product_image', 'price', 'view_count', 'rating_average')
+
+
+def search_results_json(request, products, ordering, ids, annotations=None):
+    page_size = search_page_size(request)
+    cursor = request.GET.get('cursor')
+    try:
+        page = ids_page(ids, products.only(*SEARCH_JSON_FIELDS), ordering, cursor, page_size, annotations)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    storage = Product._meta.get_field('product_image').storage
+
+    def serialize(product):
+        return {
+            'id': product.id,
+            'name': product.name,
+            'product_image': storage.url(product.product_image.name) if product.product_image else None,
+            'price': product.price,
+        }
+
+    # Facet counts describe the whole result set, so only the first page carries them.
+    extra = {'total': page.total} if cursor else {'total': page.total, 'facets': facets.compute(ids)}
+
+    if page_size <= getattr(settings, 'SEARCH_STREAM_THRESHOLD', 50):
+        product_list = [serialize(product) for product in page.items]
+        return JsonResponse({'products': product_list, 'next_cursor': page.next_cursor, **extra})
+
+    def stream():
+        yield '{"products": ['
+        for position, product in enumerate(page.items):
+            yield (',' if position else '') + json.dumps(serialize(product), cls=DjangoJSONEncoder)
+        yield '], "next_cursor": ' + json.dumps(page.next_cursor)
+        for key, value in extra.items():
+            yield f', "{key}": ' + json.dumps(value, cls=DjangoJSONEncoder)
+        yield '}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+def search_suggest(request):
+    try:
+        limit = int(request.GET.get('limit', 0)) or None
+    except ValueError:
+        limit = None
+    return JsonResponse({'suggestions': suggester.suggest(request.GET.get('query', ''), limit)})
+
+
 def search_view(request):
-    query = request.GET.get('query', '').strip()
+    query = canonical_query(request.GET.get('query', ''))
     
-    min_price = request.GET.get('min_price', None)
-    max_price = request.GET.get('max_price', None)
+    min_price = canonical_price(request.GET.get('min_price'))
+    max_price = canonical_price(request.GET.get('max_price'))
     sort_by = request.GET.get('sort_by', '')  # Sorting can be 'price', 'view_count', 'orders', or 'on_sale'
     on_sale = request.GET.get('on_sale', '')  # Filtering for on_sale
 
     products = Product.objects.all()
+    annotations = {}
 
     if query:
-        products = products.annotate(
-            match_score=Case(
-                When(name__iexact=query, then=3),  # Exact match in name
-                When(name__icontains=query, then=2),  # Partial match in name
-                When(description__icontains=query, then=1),  # Match in description
-                output_field=IntegerField(),
-            )
-        ).filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
+        # Ranked by BM25 over name, description, brand and tags; the rank is
+        # turned into a descending integer so match_score sorts the same way.
+        # It is never sent to the database: the cached ranked list already is
+        # that order, and pages get their scores in Python.
+        ranked_ids = result_cache.get_or_set(
+            make_key('match', query=query),
+            lambda: [product_id for product_id, score in search.search(query)],
         )
+        products = products.filter(id__in=list(ranked_ids))
+        annotations['match_score'] = {
+            product_id: len(ranked_ids) - position for position, product_id in enumerate(ranked_ids)
+        }
     
     if min_price:
         products = products.filter(price__gte=min_price)
     if max_price:
         products = products.filter(price__lte=max_price)
 
-    if on_sale == 'true':
+    only_on_sale = on_sale == 'true' or sort_by == 'on_sale'
+    if only_on_sale:
         products = products.filter(on_sale=True)
 
-    if sort_by == 'price':
-        products = products.order_by('price')  # Ascending order by price
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')  # Descending order by price
-    elif sort_by == 'view_count':
-        products = products.order_by('-view_count')  # Descending order by view count
-    elif sort_by == 'orders':
-        products = products.annotate(order_count=Sum('orderitem__quantity', output_field=IntegerField())).order_by('-order_count')
-    elif sort_by == 'on_sale':
-        products = products.filter(on_sale=True)  # Filter products on sale
-        products = products.order_by('price')  # Sort on-sale products by price
+    if sort_by == 'orders':
+        products = products.annotate(order_count=Coalesce(Sum('orderitem__quantity'), 0, output_field=IntegerField()))
 
-    if not sort_by:
-        products = products.order_by('-match_score')
+    # Every ordering ends in id so it is total, which keeps cursors stable.
+    if sort_by in SEARCH_ORDERINGS and (query or sort_by != 'match_score'):
+        ordering = SEARCH_ORDERINGS[sort_by]
+    elif query:
+        ordering = SEARCH_ORDERINGS['match_score']
+    else:
+        ordering = ['id']
 
-    if not sort_by:
-        products = products.order_by('-match_score')
+    def matching_ids():
+        if 'match_score' in annotations and ordering == SEARCH_ORDERINGS['match_score']:
+            matching = set(products.values_list('id', flat=True))
+            return [product_id for product_id in ranked_ids if product_id in matching]
+        return products.order_by(*ordering).values_list('id', flat=True)
 
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        product_list = [{
-            'id': product.id,
-            'name': product.name,
-            'product_image': product.product_image.url if product.product_image else None,
-            'price': product.price,
-        } for product in products]
+    ids = result_cache.get_or_set(
+        make_key('search', query=query, min_price=min_price, max_price=max_price,
+                 ordering=tuple(ordering), on_sale=only_on_sale),
+        matching_ids,
+    )
 
-        return JsonResponse({'products': product_list})
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return search_results_json(request, products, ordering, ids, annotations)
 
     categories = Category.objects.all()
+    page = ids_page(ids, products, ordering, None, search_page_size(request), annotations)
 
     context = {
-        'products': products,
+        'products': page.items,
+        'next_cursor': page.next_cursor,
+        'total': page.total,
+        'facets': facets.compute(ids),
         'categories': categories,
         'query': query,
         'min_price': min_price,
@@ -358,4 +574,82 @@ def edit_profile(request):
     else:
         form = CustomerForm(instance=customer)  
 
-    return render(request, 'edit_profile.html', {'form': form})
\ No newline at end of file
+    return render(request, 'edit_profile.html', {'form': form})
+
+
+
+@staff_member_required
+def catalog_cache_stats(request):
+    return JsonResponse(dict(catalog_cache.stats(), results=result_cache.stats()))
+
+
+@staff_member_required
+def query_budget_stats(request):
+    if request.method == 'POST':
+        query_budget.reset()
+    return JsonResponse({'views': query_budget.stats()})
+
+
+def media_file_response(request, full_path, size, content_type, etag, mtime):
+    byte_range = None
+    if request.headers.get('Range'):
+        # If-Range asks for the range only while the file is unchanged.
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == mtime:
+            try:
+                byte_range = media.parse_range(request.headers['Range'], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(media.RangeFile(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with conditional GET and byte ranges.
+
+    Whole files go out through FileResponse, which WSGI servers hand to
+    wsgi.file_wrapper/sendfile. With MEDIA_SERVE_MODE set to
+    'x-accel-redirect' or 'x-sendfile' only the headers are produced and the
+    front proxy sends the file.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("File not found.")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404("File not found.")
+
+    mtime = int(file_stat.st_mtime)
+    etag = f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        mode = media.serve_mode()
+        if mode == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/') + quote(path)
+        elif mode == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = media_file_response(request, full_path, file_stat.st_size, content_type, etag, mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = media.cache_control(path)
+    return response